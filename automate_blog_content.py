@@ -1,59 +1,201 @@
 """
 Steps before use the script:
 1. Rename .docx file name, to be the correct post title
-2. Use pandoc to convert .docx blog post to .md files, copy the .md files to the corresponding topic folder
-3. Export images from .docx file to html format, copy the images folder to the same folder as .md files
-4. Remove duplicated images in image folders
+2. Copy the .docx files to the corresponding topic folder, they are converted to .md files with their images by the
+script. Otherwise use pandoc to convert .docx blog post to .md files, copy the .md files to the corresponding topic
+folder
+3. Only when using pandoc, export images from .docx file to html format, copy the images folder to the same folder as
+.md files
+4. Identical images are found by the script, they are stored once in images folder and linked to the same file
 
 After using the script:
-Copy the images in images folder to target Jekyll image folder
+Copy the images in images folder to target Jekyll image folder, or use --jekyll-site to let the script sync them
 
 Note:
-If header_template_path is not correct, change it as per your need
+If DEFAULT_HEADER_TEMPLATE_PATH is not correct, change it as per your need
+Run 'python automate_blog_content.py run <path> <jekyll img folder>' to process the posts without prompts, or
+'python automate_blog_content.py watch <path> <jekyll img folder>' to keep processing the posts as they land in path
+Use --template to change the Jekyll post header template path
+Use --jobs N to process the posts in parallel with N worker processes
+Unchanged posts recorded in the .automate_blog_manifest.json file are skipped, use --force to process all posts
+Use --rules to replace the default rewrite rules (internal links, start angle brackets) with a json rules file
+Use --report to write the per post and per stage timings to a json/ndjson file, --profile to profile the run
+Use --optimize-images to resize and recompress the images, optionally to WebP (--webp) and with responsive variants
+(--responsive-widths), the links point at the optimized images. This needs Pillow: pip install pillow
+Run 'python automate_blog_content.py catalog <path>' to list the posts by date, the missing images (--list
+missing-images) or the posts with internal links (--list safelinks), from the .automate_blog_catalog.db catalog,
+which is also updated at the end of every run
 """
 
 import re
+import io
 import os
 import os.path
+import sys
+import time
+import select
+import struct
+import json
+import hashlib
+import argparse
+import tempfile
+import errno
+import zipfile
+import sqlite3
+from collections import namedtuple
+from xml.etree import ElementTree
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
 from datetime import datetime
-from shutil import copyfile
+from functools import partial
+from itertools import chain, islice
+from shutil import copyfileobj, copymode, rmtree
 
+import docx_to_markdown
 
-def rename_file(path):
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is only needed to optimize the images
+    Image = ImageOps = None
+# Errors of the images Pillow can't read or optimize, DecompressionBombError is not an OSError
+IMG_ERRORS = (OSError, ValueError) if Image is None else (OSError, ValueError, Image.DecompressionBombError)
+
+
+def rename_file(path, catalog=None):
     """
     This function will convert space in file name to format 'Year-Month-Day-File-Name.md'
     :param path: the path contains .md files
-    :return:
+    :param catalog: PostCatalog to take the dates from and to record the new names in, None to read the dates
+    :return: dict of the renamed .md file names, old name -> new name
     """
     blog_list = os.listdir(path)
     new_file_name = ''
+    renamed_files = {}
     for blog in blog_list:
         file_name, file_ext = os.path.splitext(blog)
         # Only rename the .md file if there's space in file name
         if 'md' in file_ext and " " in file_name:
             blog_new = blog.replace(" ", "-")
             try:
-                content_write_time = read_content_time(os.path.join(path, blog))
+                post = catalog.get_post(os.path.join(path, blog)) if catalog is not None else None
+                if post is not None and post['date']:
+                    content_write_time = post['date']
+                else:
+                    content_write_time = read_content_time(os.path.join(path, blog))
                 new_file_name = content_write_time + '-' + blog_new
                 os.rename(os.path.join(path, blog), os.path.join(path, new_file_name))
+                if catalog is not None:
+                    catalog.rename(blog, new_file_name)
+                renamed_files[blog] = new_file_name
                 print("Convert file name successfully!")
             except FileExistsError:
                 print("Target file with name {0} already exists!".format(new_file_name))
     print("======================================")
+    return renamed_files
 
 
 def read_content_time(file_path):
     """
-    This function will look for the No.3 lines in the .md file and read the time date
+    This function will look for the No.3 lines in the .md file and read the time date, only the first lines of the
+    file are read
     :param file_path: .md file path
     :return: The time date with format 'Year-Month-Day'
     """
-    # print(file_path)
     with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.readlines()
-        content_time_str = content[2].rstrip("\n")
-        content_time = datetime.strptime(content_time_str, '%A, %B %d, %Y').date()
-        return content_time.strftime('%Y-%m-%d')
+        content = list(islice(f, 3))
+    return parse_content_time(content[2])
+
+
+def parse_content_time(line):
+    """
+    :param line: The time date line of the post, like 'Monday, March 2, 2020'
+    :return: The time date with format 'Year-Month-Day'
+    """
+    content_time = datetime.strptime(line.rstrip("\n"), '%A, %B %d, %Y').date()
+    return content_time.strftime('%Y-%m-%d')
+
+
+# Metadata of a post found in its header. front_matter: the post has the Jekyll header already. title: the title of
+# the Jekyll header, or the first line of the post. date: 'Year-Month-Day' of the file name or of the time date line,
+# None if not found. author: the author line of the post, None if the post has none.
+PostMetadata = namedtuple('PostMetadata', ['front_matter', 'title', 'date', 'author'])
+# Maximum number of lines read to find the metadata, the Jekyll header or the header of the post fit in it
+POST_HEAD_LINE_COUNT = 32
+POST_DATE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})-')
+
+
+def read_post_head(file_path, line_count=POST_HEAD_LINE_COUNT):
+    """
+    :param file_path: .md file path
+    :param line_count: Number of lines to read
+    :return: The first lines of the .md file, the rest of the file is not read
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return list(islice(f, line_count))
+
+
+def parse_post_metadata(file_name, head_lines):
+    """
+    This function will find the metadata of a post in its first lines, either in the Jekyll header or in the header
+    of the post: title line, time date line (No.3 line) and author line (No.7 line, has '\xa0')
+    :param file_name: The .md file name
+    :param head_lines: The first lines of the .md file, see read_post_head
+    :return: PostMetadata
+    """
+    front_matter = bool(head_lines) and '---' in head_lines[0]
+    date_match = POST_DATE_PATTERN.match(file_name)
+    date = date_match.group(1) if date_match else None
+    title = None
+    author = None
+    if front_matter:
+        for line in head_lines[1:]:
+            if line.startswith('---'):
+                break
+            key, _, value = line.partition(':')
+            if key.strip() == 'title':
+                title = value.strip().strip('"')
+            elif key.strip() == 'author':
+                author = value.strip().strip('"')
+    else:
+        if head_lines:
+            title = head_lines[0].strip().lstrip('#').strip()
+        if date is None and len(head_lines) > 2:
+            try:
+                date = parse_content_time(head_lines[2])
+            except ValueError:
+                pass
+        if len(head_lines) > 6 and '\xa0' in head_lines[6]:
+            author = head_lines[6].replace('\xa0', ' ').strip()
+    return PostMetadata(front_matter, title, date, author)
+
+
+def read_post_metadata(file_path):
+    """
+    This function will return the metadata of a post, reading only the first lines of the .md file
+    :param file_path: .md file path
+    :return: PostMetadata
+    """
+    return parse_post_metadata(os.path.basename(file_path), read_post_head(file_path))
+
+
+_header_templates = {}
+
+
+def read_header_template(template_path):
+    """
+    This function will return the lines of the Jekyll post header template. The template is read once and kept in
+    memory, it's read again only when the template file has been modified.
+    :param template_path: The path contains the Jekyll post header template
+    :return: A copy of the template lines
+    """
+    mtime_ns = os.stat(template_path).st_mtime_ns
+    cached = _header_templates.get(template_path)
+    if cached is None or cached[0] != mtime_ns:
+        with open(template_path, 'r', encoding='utf-8') as f:
+            cached = (mtime_ns, f.readlines())
+        _header_templates[template_path] = cached
+    return list(cached[1])
 
 
 def generate_header(template_path, file_name):
@@ -66,263 +208,2651 @@ def generate_header(template_path, file_name):
     file_name_list = file_name.split('-')[3:]
     separator = ' '
     post_title = separator.join(file_name_list)
-    with open(template_path, 'r', encoding='utf-8') as f:
-        content = f.readlines()
-        content[2] = 'title: "{0}"\n'.format(post_title)
-        return content
+    content = read_header_template(template_path)
+    content[2] = 'title: "{0}"\n'.format(post_title)
+    return content
 
 
-def modify_blog_header(template_path, file_path):
+class BlogDocument(object):
     """
-    This function will modify the blog header with the jekyll post header template.
+    In-memory representation of a .md post. The file is read once on creation, transform passes modify
+    document.lines in place, and save() writes the file back once, only if the content changed.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.base_path = os.path.dirname(file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            self.lines = f.readlines()
+            file_size = os.fstat(f.fileno()).st_size
+        self._original_content = ''.join(self.lines)
+        # Statistics collected by the passes, e.g. rewrite rule hits. The counters are broken down per stage by
+        # run_pipeline.
+        self.stats = {'bytes_read': file_size, 'bytes_written': 0, 'matches': 0, 'warnings': []}
+
+    @property
+    def changed(self):
+        return ''.join(self.lines) != self._original_content
+
+    def save(self):
+        """
+        Write the document back to disk atomically, only when the content changed.
+        :return: True if the file has been written, otherwise False
+        """
+        if not self.changed:
+            return False
+        content = ''.join(self.lines)
+        # Write to a temp file in the same folder, then replace the .md file so a failed write never leaves a
+        # truncated post behind.
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + self.file_name, suffix='.tmp', dir=self.base_path or None)
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            copymode(self.file_path, tmp_path)
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._original_content = content
+        self.stats['bytes_written'] += os.path.getsize(self.file_path)
+        return True
+
+    def warn(self, message):
+        """
+        Record a problem which doesn't stop the pipeline, e.g. a mismatch between the image links and images.
+        """
+        self.stats['warnings'].append(message)
+
+
+def modify_blog_header_pass(document, template_path):
+    """
+    Transform pass, modify the blog header with the jekyll post header template.
+    :param document: The BlogDocument of the .md file
     :param template_path: The path contain the Jekyll post header template
-    :param file_path: The .md file path
     :return:
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        file_lines = f.readlines()
-        # Return directory without making any change if the file header already matches with Jekyll template
-        if '---' in file_lines[0]:
+    file_lines = document.lines
+    # Return directory without making any change if the file header already matches with Jekyll template
+    if '---' in file_lines[0]:
+        return
+    # Get the first 8 lines of the .md file, No.7 line has 'xa0' means this file contain the author header. \
+    # Should be handled differently.
+    header_content = file_lines[:8]
+    if 'xa0' not in repr(header_content[6]):
+        header_content = header_content[:6]
+    file_name = document.file_name.split('.')[0]
+    blog_template_header = generate_header(template_path, file_name)
+    for i in range(0, len(header_content)):
+        if i == len(header_content) - 1:
+            file_lines[i] = ''
+            for j in range(i, len(blog_template_header)):
+                file_lines[i] += blog_template_header[j]
+        else:
+            file_lines[i] = blog_template_header[i]
+
+
+# Rewrite rules applied to every post by default. Each rule has a name, a regex pattern, a replacement which can use
+# the groups of the pattern (e.g. \1), a scope and optional regex flags.
+DEFAULT_REWRITE_RULES = [
+    {
+        # Internal links start with https://nam06..., keep the link text of [text](internal link)
+        'name': 'internal_link',
+        'pattern': r'\[([^\]\n]*)\]\(https://[^)\s]*safelinks\.protection\.outlook\.com[^)\s]*\)',
+        'replacement': r'\1',
+        'scope': 'body',
+        'flags': 'i',
+    },
+    {
+        'name': 'bare_internal_link',
+        'pattern': r'\(https://[^)\s]*safelinks\.protection\.outlook\.com[^)\s]*\)',
+        'replacement': '',
+        'scope': 'body',
+        'flags': 'i',
+    },
+    {
+        # '>' at the beginning of a line
+        'name': 'start_bracket',
+        'pattern': r'^>',
+        'replacement': '',
+        'scope': 'body',
+    },
+]
+# 'body' rules don't change the Jekyll front matter, 'all' rules apply to the whole post
+REWRITE_RULE_SCOPES = ('body', 'all')
+REWRITE_RULE_FLAGS = 'isx'
+# Tokens of a pattern which can hide a group reference: octal escapes, other escapes, character classes, then the
+# numeric backreferences (group 1) and the conditionals on a group number (group 2)
+GROUP_REFERENCE_PATTERN = re.compile(r'\\(?:0[0-7]{0,2}|[0-7]{3})|\\([1-9]\d?)|\\.|\[\^?\]?(?:\\.|[^\]\\])*\]|'
+                                     r'\(\?\((\d+)\)', re.DOTALL)
+
+
+def find_group_reference(pattern):
+    """
+    This function will find the first reference to a group by its number in a regex pattern, e.g. \\1 or (?(1)...).
+    Octal escapes and the content of character classes are not group references.
+    :param pattern: The regex pattern
+    :return: The referenced group number, None if the pattern has no such reference
+    """
+    for match in GROUP_REFERENCE_PATTERN.finditer(pattern):
+        group_number = match.group(1) or match.group(2)
+        if group_number:
+            return int(group_number)
+    return None
+
+
+def load_rewrite_rules(rules_path):
+    """
+    This function will load the rewrite rules from a json file, which contains a list of rules like
+    {"name": "...", "pattern": "...", "replacement": "...", "scope": "body", "flags": "i"}
+    :param rules_path: The rules file path
+    :return: List of rules
+    """
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError("Rewrite rules file {0} should contain a list of rules.".format(rules_path))
+    return rules
+
+
+def get_front_matter_end(content):
+    """
+    This function will return the position right after the Jekyll front matter of the post
+    :param content: The .md file content
+    :return: The position where the post body starts, 0 if there's no front matter
+    """
+    if not content.startswith('---'):
+        return 0
+    match = re.compile(r'^---[ \t]*$\n?', re.MULTILINE).search(content, content.find('\n') + 1)
+    return match.end() if match is not None else 0
+
+
+class RewriteEngine(object):
+    """
+    Transform pass applying all rewrite rules to the post. The rules are compiled once into a single regex which
+    alternates them, so the post is scanned once whatever the number of rules. When several rules match at the same
+    position, the first one in the list wins. The groups are numbered across all rules in the combined regex, so
+    patterns can't refer to their own groups by number (e.g. \\1 in the pattern), only by name (e.g. (?P=name)) as the
+    group names are unique across the rules. Replacements can refer to the groups either way.
+    """
+
+    stage_name = 'rewrite_rules'
+
+    def __init__(self, rules):
+        self.rules = []
+        # Index of the outer group of each rule in the combined regex -> rule
+        self._rules_by_group = {}
+        alternatives = []
+        group_index = 1
+        # Group name -> name of the rule which defines it
+        group_names = {}
+        for rule in rules:
+            name = rule['name']
+            scope = rule.get('scope', 'body')
+            flags = rule.get('flags', '')
+            if scope not in REWRITE_RULE_SCOPES:
+                raise ValueError("Invalid scope {0} of rewrite rule {1}, should be one of {2}."
+                                 .format(scope, name, ', '.join(REWRITE_RULE_SCOPES)))
+            if any(flag not in REWRITE_RULE_FLAGS for flag in flags):
+                raise ValueError("Invalid flags {0} of rewrite rule {1}.".format(flags, name))
+            pattern = rule['pattern']
+            if 'x' in flags:
+                # A comment at the end of a verbose pattern would hide the closing parenthesis
+                pattern += '\n'
+            pattern = '(?{0}:{1})'.format(flags, pattern) if flags else '(?:{0})'.format(pattern)
+            try:
+                regex = re.compile(pattern, re.MULTILINE)
+            except re.error as e:
+                raise ValueError("Invalid pattern of rewrite rule {0}: {1}".format(name, e))
+            group_number = find_group_reference(rule['pattern'])
+            if group_number is not None:
+                raise ValueError("Pattern of rewrite rule {0} refers to group {1} by number, which can't be combined "
+                                 "with the other rules. Name the group and refer to it with (?P=name) instead."
+                                 .format(name, group_number))
+            for group_name in regex.groupindex:
+                if group_name in group_names:
+                    raise ValueError("Group name {0} of rewrite rule {1} is already used by rewrite rule {2}."
+                                     .format(group_name, name, group_names[group_name]))
+                group_names[group_name] = name
+            compiled_rule = (name, regex, rule.get('replacement', ''), scope)
+            self.rules.append(compiled_rule)
+            self._rules_by_group[group_index] = compiled_rule
+            group_index += 1 + regex.groups
+            alternatives.append('({0})'.format(pattern))
+        try:
+            self.regex = re.compile('|'.join(alternatives), re.MULTILINE) if alternatives else None
+        except re.error as e:
+            raise ValueError("Rewrite rules can't be combined: {0}".format(e))
+
+    def __call__(self, document):
+        if self.regex is None:
             return
-        # Get the first 8 lines of the .md file, No.7 line has 'xa0' means this file contain the author header. \
-        # Should be handled differently.
-        header_content = file_lines[:8]
-        if 'xa0' not in repr(header_content[6]):
-            header_content = header_content[:6]
-        file_name = f.name.split('\\')[-1].split('.')[0]
-        blog_template_header = generate_header(template_path, file_name)
-        for i in range(0, len(header_content)):
-            if i == len(header_content) - 1:
-                file_lines[i] = ''
-                for j in range(i, len(blog_template_header)):
-                    file_lines[i] += blog_template_header[j]
-            else:
-                file_lines[i] = blog_template_header[i]
-    # Write changes to the .md file
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            for data in file_lines:
-                f.write(data)
-            f.flush()
-    except Exception as e:
-        print(e)
+        content = ''.join(document.lines)
+        body_start = get_front_matter_end(content)
+        rule_hits = document.stats.setdefault('rule_hits', {})
 
+        def replace(match):
+            name, regex, replacement, scope = self._rules_by_group[match.lastindex]
+            if scope == 'body' and match.start() < body_start:
+                return match.group()
+            rule_hits[name] = rule_hits.get(name, 0) + 1
+            document.stats['matches'] += 1
+            # Match the rule alone at the same position to expand its own groups in the replacement
+            return regex.match(content, match.start()).expand(replacement)
 
-def remove_internal_links(file_path):
+        new_content = self.regex.sub(replace, content)
+        if new_content != content:
+            document.lines = new_content.splitlines(True)
+
+
+# The engines are compiled once, the rules are combined and validated when the module is loaded
+DEFAULT_REWRITE_ENGINE = RewriteEngine(DEFAULT_REWRITE_RULES)
+INTERNAL_LINK_ENGINE = RewriteEngine([rule for rule in DEFAULT_REWRITE_RULES
+                                      if rule['name'] in ('internal_link', 'bare_internal_link')])
+START_BRACKET_ENGINE = RewriteEngine([rule for rule in DEFAULT_REWRITE_RULES if rule['name'] == 'start_bracket'])
+
+
+FINAL_IMG_LINK_PATTERN = re.compile(r'^!\[\d+\]\(/assets/images/[^)]+\)(\{:[^}]*\})?$')
+
+
+def modify_image_link_pass(document, target_jekyll_img_folder, img_settings=None):
     """
-    This function will remove the internal links start with https://nam06...
-    :param file_path: The .md file path
+    Transform pass, modify the image links in .md file to format like ![1](/assets/images/img_folder/image.jpg).
+    The image files are renamed and copied to 'images' folder as well.
+    :param document: The BlogDocument of the .md file
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :param img_settings: ImageOptimizeSettings to link to the optimized images, None to link to the images as they are
     :return:
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        file_lines = f.readlines()
-        # Use regex to match the internal links in line
-        pattern = re.compile(r'\(https://.+safelinks\.protection\.outlook\.com.+?\)', re.MULTILINE | re.IGNORECASE)
-        match_count = 0
-        # Remove the internal links from lines
+    file_path = document.file_path
+    file_name = document.file_name
+    file_lines = document.lines
+    img_list = get_img_list(file_path)
+    # Replace image link in .md file with desired format
+    pattern = re.compile(r'/image', re.IGNORECASE)
+    match_count = 0
+    matched_line_num = []
+    try:
         for i in range(0, len(file_lines)):
             rest = pattern.findall(file_lines[i])
             if len(rest) != 0:  # match found
                 match_count += 1
-                for j in range(0, len(rest)):
-                    file_lines[i] = file_lines[i].replace(rest[j], '').replace('[', '').replace(']', '')
-    # Write changes to the .md file, only do this when match found
+                matched_line_num.append(i)
+        document.stats['matches'] += match_count
+        # Posts ingested from .docx have no img folder, their image links are already in the final format
+        if matched_line_num and not get_img_folder_name(file_path) and \
+                all(FINAL_IMG_LINK_PATTERN.match(file_lines[i]) for i in matched_line_num):
+            return
+        # Only rename and copy images when match_count = image count
+        if match_count != len(img_list):
+            document.warn('Img matched count {0} in .md file not equal with img count {1}.'
+                          .format(match_count, len(img_list)))
+            print('Error occurred! Img matched count in .md file not equal with img count. Will not perform image '
+                  'rename, copy and modify image link in .md file.\nmd file name: {0}\nmatch_count in md: {1}\n'
+                  'img count in image folder: {2}'.format(file_name, match_count, len(img_list)))
+            print('======================================')
+        else:
+            conflicts = []
+            document.stats['bytes_written'] += rename_img_file(file_path, conflicts)
+            if conflicts:
+                document.warn("Images {0} already exist in 'images' folder with different content, image links are "
+                              "not modified.".format(', '.join(conflicts)))
+                return
+            index = get_img_folder_index(document.base_path)
+            img_folder = index.find_folder(get_post_title(file_path))
+            img_list_after_rename = index.get_images(img_folder)
+            img_list_after_rename.sort()
+            for i in range(0, len(matched_line_num)):
+                # Link to the canonical image, identical images are stored once
+                img_path = os.path.join(document.base_path, 'images',
+                                        index.get_canonical_image(img_folder, img_list_after_rename[i]))
+                file_lines[matched_line_num[i]] = format_img_link(i, target_jekyll_img_folder, img_path,
+                                                                  img_settings) + "\n"
+    except IndexError as e:
+        document.warn("Failed to modify image link at line {0}: {1}".format(str(i+1), e))
+        print("Failed to modify image link for blog: {0}\nLine_No: {1}".format(file_name, str(i+1)))
+        print(e)
+
+
+def default_passes(template_path, target_jekyll_img_folder, rewrite_rules=None, img_settings=None):
+    """
+    This function will return the default ordered list of transform passes
+    :param template_path: The path contain the Jekyll post header template
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :param rewrite_rules: List of rewrite rules, DEFAULT_REWRITE_RULES if None
+    :param img_settings: ImageOptimizeSettings to link to the optimized images, None to link to the images as they are
+    :return: list of passes, each pass accepts a BlogDocument
+    """
+    return [
+        partial(modify_blog_header_pass, template_path=template_path),
+        DEFAULT_REWRITE_ENGINE if rewrite_rules is None else RewriteEngine(rewrite_rules),
+        partial(modify_image_link_pass, target_jekyll_img_folder=target_jekyll_img_folder, img_settings=img_settings),
+    ]
+
+
+class PipelineStageError(Exception):
+    """
+    Raised when a stage of the pipeline fails, tells which stage failed. stats holds the statistics of the post
+    collected until the failure.
+    """
+
+    def __init__(self, stage_name, error, stats):
+        super(PipelineStageError, self).__init__("Stage {0} failed: {1}: {2}".format(stage_name,
+                                                                                   type(error).__name__, error))
+        self.stage_name = stage_name
+        self.stats = stats
+
+
+class RunStageError(Exception):
+    """
+    Raised when a stage of the whole run fails, e.g. publishing the images, tells which stage failed.
+    """
+
+    def __init__(self, stage_name, error):
+        super(RunStageError, self).__init__("Run stage {0} failed: {1}: {2}".format(stage_name,
+                                                                                  type(error).__name__, error))
+        self.stage_name = stage_name
+
+
+# Counters of BlogDocument.stats which are broken down per stage
+STAGE_COUNTERS = ('bytes_read', 'bytes_written', 'matches')
+
+
+def get_stage_name(transform):
+    """
+    :param transform: A transform pass
+    :return: The name of the pass in the stage records, e.g. 'modify_blog_header' for modify_blog_header_pass
+    """
+    stage_name = getattr(transform, 'stage_name', None)
+    if stage_name:
+        return stage_name
+    func = transform.func if isinstance(transform, partial) else transform
+    stage_name = getattr(func, '__name__', type(func).__name__)
+    return stage_name[:-len('_pass')] if stage_name.endswith('_pass') else stage_name
+
+
+def record_stage(document, stage_record):
+    """
+    Default stage hook, keep the stage record in the statistics of the post.
+    """
+    document.stats.setdefault('stages', []).append(stage_record)
+
+
+def run_stage(document, stage_name, func, hooks):
+    """
+    This function will run one stage of the pipeline and call the hooks with its stage record: duration, the
+    counters of the stage, and the outcome 'ok', 'warning' or 'error'.
+    :param document: The BlogDocument of the .md file
+    :param stage_name: The stage name
+    :param func: Function without parameters running the stage
+    :param hooks: Callables accepting (document, stage record)
+    :return:
+    """
+    counters_before = [document.stats[counter] for counter in STAGE_COUNTERS]
+    warning_count = len(document.stats['warnings'])
+    stage_record = {'stage': stage_name, 'outcome': 'ok'}
+    start = time.perf_counter()
     try:
-        if match_count > 0:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for data in file_lines:
-                    f.write(data)
-                f.flush()
+        func()
     except Exception as e:
-        print(e)
+        stage_record['outcome'] = 'error'
+        stage_record['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        raise PipelineStageError(stage_name, e, document.stats) from e
+    finally:
+        stage_record['duration'] = time.perf_counter() - start
+        for counter, value in zip(STAGE_COUNTERS, counters_before):
+            stage_record[counter] = document.stats[counter] - value
+        if len(document.stats['warnings']) > warning_count:
+            stage_record['warnings'] = document.stats['warnings'][warning_count:]
+            if stage_record['outcome'] == 'ok':
+                stage_record['outcome'] = 'warning'
+        for hook in hooks:
+            hook(document, stage_record)
 
 
-def remove_start_brackets(file_path):
+def run_pipeline(file_path, passes, hooks=(record_stage,)):
     """
-    This function will remove the '>' at the beginning of a line
+    This function will load the .md file once, run the transform passes in order in memory, and write the file
+    once only if something changed. Loading, every pass and saving are stages, the hooks are called after each.
     :param file_path: The .md file path
-    :return:
+    :param passes: Ordered list of transform passes, each pass accepts a BlogDocument
+    :param hooks: Callables accepting (document, stage record), called after each stage
+    :return: The BlogDocument after all passes
     """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        file_lines = f.readlines()
-        pattern = re.compile(r'^>')
-        match_count = 0
-        # Remove the start angle bracket from lines
-        for i in range(0, len(file_lines)):
-            rest = pattern.match(file_lines[i])
-            if rest is not None:    # match found
-                match_count += 1
-                file_lines[i] = file_lines[i].replace('>', '', 1)
-    # Write changes to the .md file, only do this when match found
+    start = time.perf_counter()
     try:
-        if match_count > 0:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for data in file_lines:
-                    f.write(data)
-                f.flush()
+        document = BlogDocument(file_path)
     except Exception as e:
-        print(e)
+        raise PipelineStageError('load', e, {}) from e
+    load_record = {'stage': 'load', 'outcome': 'ok', 'duration': time.perf_counter() - start,
+                   'bytes_read': document.stats['bytes_read'], 'bytes_written': 0, 'matches': 0}
+    for hook in hooks:
+        hook(document, load_record)
+    for transform in passes:
+        run_stage(document, get_stage_name(transform), partial(transform, document), hooks)
+    # Write changes to the .md file, only do this when content changed
+    run_stage(document, 'save', document.save, hooks)
+    document.stats['duration'] = time.perf_counter() - start
+    return document
 
 
-def get_img_folder_name(file_path):
+# Bump this when the passes change the output, so that the posts processed by an older version are processed again
+PIPELINE_VERSION = '2'
+MANIFEST_FILE_NAME = '.automate_blog_manifest.json'
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
     """
-    This function will return the img folder name of input post by accepting the .md file path
-    :param file_path: .md file path
-    :return: img folder name
+    This function will return the sha256 of the file, read in chunks
+    :param file_path: The file path
+    :param chunk_size: The chunk size in bytes
+    :return: Hex digest of the file content
     """
-    file_name = os.path.basename(file_path)
-    base_path = os.path.dirname(file_path)
-    file_name_list = file_name.split('-')[3:]
-    separator = ' '
-    post_title = separator.join(file_name_list).replace(".md", "")
-    img_folder_name = ''
-    for item in os.listdir(base_path):
-        if os.path.isdir(os.path.join(base_path, item)) and post_title in item.replace("-", " "):
-            img_folder_name = item
-    return img_folder_name
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(partial(f.read, chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
 
-def get_img_list(file_path):
+def build_file_record(file_path):
     """
-    This function will return the img list of input post by accepting the .md file path
-    :param file_path: .md file path
-    :return: img list
+    This function will return the manifest record of a file
+    :param file_path: The file path
+    :return: dict with size, mtime_ns and sha256 of the file
     """
-    base_path = os.path.dirname(file_path)
-    img_folder_name = get_img_folder_name(file_path)
-    # print(image_folder_name)
-    content_list = os.listdir(os.path.join(base_path, img_folder_name))
-    img_list = []
-    for item in content_list:
-        file_ext = os.path.splitext(item)[1]
-        if file_ext in ['.jpg', '.gif', '.png']:
-            img_list.append(item)
-    return img_list
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': hash_file(file_path)}
 
 
-def rename_img_file(file_path):
+def build_post_record(file_path):
     """
-    This function will rename the image files from 'image00x' to 'first 20 chars of post name + _image00x'.
-    This will ensure image name is unique so that we can add it in to Jekyll blogs.
-    This function will also copy the image files into the images folder within path.
+    This function will return the manifest record of a .md file, including the images in its img folder. The images
+    hashed before keep their hash as long as they don't change, see ImgFolderIndex.add_known_hashes
     :param file_path: The .md file path
-    :return:
+    :return: dict of the post record
     """
-    file_name = os.path.basename(file_path)
-    base_path = os.path.dirname(file_path)
-    img_folder = get_img_folder_name(file_path)
-    img_file_list = get_img_list(file_path)
-    img_file_list.sort()
-    new_file_name = ''
-    try:
-        for i in range(0, len(img_file_list)):
-            new_file_ext = os.path.splitext(img_file_list[i])[1]
-            # Don't make any change if the image file name not start with 'image', which means it already has been \
-            # renamed.
-            if img_file_list[i][:5] != 'image':
-                continue
-            else:
-                # Rename the image file
-                new_file_name = img_folder.replace(" ", "_")[0:19] + '_image0' + str(i+1).zfill(2) + new_file_ext
-                os.rename(os.path.join(base_path, img_folder, img_file_list[i]), os.path.join(base_path, img_folder,
-                                                                                              new_file_name))
-                copy_src = os.path.join(base_path, img_folder, new_file_name)
-                copy_dst = os.path.join(base_path, 'images', new_file_name)
-                # Copy image file to 'images' folder if image does not exist
-                if not os.path.exists(copy_dst):
-                    copyfile(copy_src, copy_dst)
-        print("Rename and copy image files successfully! .md file name: {0}.".format(file_name))
-    except FileExistsError:
-        print("Target img file with name {0} already exists!".format(new_file_name))
-    print("======================================")
+    index = get_img_folder_index(os.path.dirname(file_path))
+    img_folder = index.find_folder(get_post_title(file_path))
+    record = build_file_record(file_path)
+    record['img_folder'] = img_folder
+    record['images'] = {}
+    for img in index.get_images(img_folder):
+        img_path = os.path.join(index.base_path, img_folder, img)
+        stat = os.stat(img_path)
+        record['images'][img] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                 'sha256': index.hash_image(img_path, stat)}
+    return record
 
 
-def modify_image_link(file_path, target_jekyll_img_folder):
+class BlogManifest(object):
     """
-    This function will modify the image links in .md file to format like ![1](/assets/images/img_folder/image.jpg)
+    Persistent manifest of the processed posts, stored as json in the path contains the .md files.
+    A post is unchanged when the pipeline version matches and the .md file and the images in its img folder have the
+    same size and mtime as recorded, so that it can be skipped without being opened. When only the mtime differs,
+    the content hash decides.
+    """
+
+    def __init__(self, blog_path, version):
+        self.manifest_path = os.path.join(blog_path, MANIFEST_FILE_NAME)
+        self.version = version
+        self.posts = {}
+        # .docx file name -> record of the .docx file, with the images it wrote to 'images' folder
+        self.docx_files = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                self.posts = manifest.get('posts', {})
+                self.docx_files = manifest.get('docx_files', {})
+            except ValueError:
+                print("Manifest file {0} is broken, all blogs will be processed.".format(self.manifest_path))
+
+    @staticmethod
+    def _file_unchanged(file_path, record):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != record['size']:
+            return False
+        if stat.st_mtime_ns != record['mtime_ns']:
+            # Touched but maybe not modified, compare the content
+            if hash_file(file_path) != record['sha256']:
+                return False
+            record['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def is_unchanged(self, file_path):
+        """
+        :param file_path: The .md file path
+        :return: True if the post and its images are unchanged since they have been recorded
+        """
+        record = self.posts.get(os.path.basename(file_path))
+        if record is None or record.get('version') != self.version:
+            return False
+        if not self._file_unchanged(file_path, record):
+            return False
+        index = get_img_folder_index(os.path.dirname(file_path))
+        img_folder = index.find_folder(get_post_title(file_path))
+        if img_folder != record['img_folder'] or set(index.get_images(img_folder)) != set(record['images']):
+            return False
+        for img, img_record in record['images'].items():
+            if not self._file_unchanged(os.path.join(index.base_path, img_folder, img), img_record):
+                return False
+        return True
+
+    def get_image_hashes(self):
+        """
+        :return: dict image path -> (size, mtime_ns, sha256) of the images recorded with the posts
+        """
+        base_path = os.path.abspath(os.path.dirname(self.manifest_path))
+        image_hashes = {}
+        for record in self.posts.values():
+            for img, img_record in record.get('images', {}).items():
+                image_hashes[os.path.join(base_path, record['img_folder'], img)] = \
+                    (img_record['size'], img_record['mtime_ns'], img_record['sha256'])
+        return image_hashes
+
+    def record(self, file_name, post_record):
+        post_record['version'] = self.version
+        self.posts[file_name] = post_record
+
+    def is_docx_unchanged(self, docx_path):
+        """
+        :param docx_path: The .docx file path
+        :return: True if the .docx file is unchanged since it has been recorded, False if it changed or has not been
+            recorded
+        """
+        record = self.docx_files.get(os.path.basename(docx_path))
+        return record is not None and 'sha256' in record and self._file_unchanged(docx_path, record)
+
+    def record_docx(self, docx_path):
+        """
+        Record the size, mtime and hash of the .docx file, with the images it wrote kept.
+        :param docx_path: The .docx file path
+        """
+        self.docx_files.setdefault(os.path.basename(docx_path), {}).update(build_file_record(docx_path))
+
+    def get_docx_images(self, docx_file_name):
+        """
+        :param docx_file_name: The .docx file name
+        :return: dict image file name -> sha256 of the images the .docx file wrote to 'images' folder, see ingest_docx
+        """
+        return self.docx_files.setdefault(docx_file_name, {}).setdefault('images', {})
+
+    def prune(self, file_names):
+        """
+        Remove the records of the posts which no longer exist.
+        :param file_names: The .md file names which exist
+        """
+        file_names = set(file_names)
+        for file_name in list(self.posts):
+            if file_name not in file_names:
+                del self.posts[file_name]
+
+    def prune_docx(self, docx_file_names):
+        """
+        Remove the records of the .docx files which no longer exist.
+        :param docx_file_names: The .docx file names which exist
+        """
+        docx_file_names = set(docx_file_names)
+        for docx_file_name in list(self.docx_files):
+            if docx_file_name not in docx_file_names:
+                del self.docx_files[docx_file_name]
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(prefix=MANIFEST_FILE_NAME, suffix='.tmp',
+                                        dir=os.path.dirname(self.manifest_path) or None)
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump({'pipeline_version': PIPELINE_VERSION, 'posts': self.posts, 'docx_files': self.docx_files}, f,
+                          indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+CATALOG_FILE_NAME = '.automate_blog_catalog.db'
+# Change it when the tables or the scanned metadata change, the catalog is built again
+CATALOG_VERSION = 1
+CATALOG_SCHEMA = """
+DROP TABLE IF EXISTS posts;
+DROP TABLE IF EXISTS post_images;
+DROP TABLE IF EXISTS images;
+DROP TABLE IF EXISTS img_folders;
+CREATE TABLE posts (
+    file_name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    front_matter INTEGER NOT NULL,
+    title TEXT,
+    date TEXT,
+    author TEXT,
+    img_folder TEXT NOT NULL DEFAULT '',
+    image_link_count INTEGER NOT NULL,
+    link_count INTEGER NOT NULL,
+    safelink_count INTEGER NOT NULL
+);
+CREATE INDEX posts_date ON posts (date);
+CREATE TABLE post_images (
+    file_name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    link TEXT NOT NULL,
+    image_name TEXT NOT NULL,
+    PRIMARY KEY (file_name, position)
+);
+CREATE TABLE images (name TEXT PRIMARY KEY);
+CREATE TABLE img_folders (name TEXT PRIMARY KEY, image_count INTEGER NOT NULL);
+"""
+POST_IMG_LINK_PATTERN = re.compile(r'!\[[^\]\n]*\]\(([^)\s]+)')
+POST_LINK_PATTERN = re.compile(r'(?<!!)\[[^\]\n]*\]\(([^)\s]+)')
+SAFELINK_PATTERN = re.compile(r'safelinks\.protection\.outlook\.com', re.IGNORECASE)
+
+
+CatalogEntry = namedtuple('CatalogEntry', ['size', 'mtime_ns', 'metadata', 'image_links', 'link_count',
+                                           'safelink_count'])
+
+
+def scan_post_lines(file_name, lines, stat):
+    """
+    This function will read the catalog entry of a post: its metadata, its image links and its link stats
+    :param file_name: The .md file name
+    :param lines: Iterable of the lines of the .md file, e.g. the open file or the lines of a BlogDocument
+    :param stat: os.stat_result of the .md file, with the same content as the lines
+    :return: CatalogEntry of the post
+    """
+    lines = iter(lines)
+    head_lines = list(islice(lines, POST_HEAD_LINE_COUNT))
+    metadata = parse_post_metadata(file_name, head_lines)
+    image_links = []
+    link_count = 0
+    safelink_count = 0
+    for line in chain(head_lines, lines):
+        if '](' not in line and 'safelinks' not in line.lower():
+            continue
+        image_links.extend(POST_IMG_LINK_PATTERN.findall(line))
+        link_count += len(POST_LINK_PATTERN.findall(line))
+        safelink_count += len(SAFELINK_PATTERN.findall(line))
+    return CatalogEntry(stat.st_size, stat.st_mtime_ns, metadata, image_links, link_count, safelink_count)
+
+
+class PostCatalog(object):
+    """
+    Persistent catalog of the posts, stored as SQLite in the path contains the .md files: the metadata of every post
+    (see PostMetadata), its img folder, its image links and its link stats, with the images of the 'images' folder.
+    update() scans only the posts whose size or mtime changed since they have been catalogued, so the listings don't
+    read the whole archive.
+    """
+
+    def __init__(self, blog_path):
+        self.blog_path = blog_path
+        self.connection = sqlite3.connect(os.path.join(blog_path, CATALOG_FILE_NAME))
+        self.connection.row_factory = sqlite3.Row
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != CATALOG_VERSION:
+            with self.connection:
+                self.connection.executescript(CATALOG_SCHEMA)
+                self.connection.execute('PRAGMA user_version = {0}'.format(CATALOG_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.connection.close()
+
+    def _scan_post(self, file_path, stat):
+        file_name = os.path.basename(file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            # The post is streamed, only the links are kept
+            entry = scan_post_lines(file_name, f, stat)
+        self._insert_post(file_name, entry)
+
+    def _insert_post(self, file_name, entry):
+        metadata = entry.metadata
+        self.connection.execute('INSERT OR REPLACE INTO posts (file_name, size, mtime_ns, front_matter, title, date, '
+                                'author, image_link_count, link_count, safelink_count) '
+                                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                (file_name, entry.size, entry.mtime_ns, metadata.front_matter, metadata.title,
+                                 metadata.date, metadata.author, len(entry.image_links), entry.link_count,
+                                 entry.safelink_count))
+        self.connection.execute('DELETE FROM post_images WHERE file_name = ?', (file_name,))
+        self.connection.executemany('INSERT INTO post_images VALUES (?, ?, ?, ?)',
+                                    [(file_name, i, link, link.rsplit('/', 1)[-1])
+                                     for i, link in enumerate(entry.image_links)])
+
+    def record_posts(self, entries):
+        """
+        Catalog the posts which have been read already, e.g. by the pipeline, so that update() doesn't read them again
+        as long as they don't change.
+        :param entries: Iterable of (file name, CatalogEntry)
+        """
+        with self.connection:
+            for file_name, entry in entries:
+                self._insert_post(file_name, entry)
+
+    def update(self):
+        """
+        Catalog the new and changed posts, remove the posts which no longer exist, and record the img folders of the
+        posts, the image count of the img folders and the images of the 'images' folder and of its 'optimized'
+        folder. The img folders and images are not read from the posts, so they are recorded again every time.
+        :return: (scanned post count, removed post count)
+        """
+        index = get_img_folder_index(self.blog_path)
+        catalogued = dict((row['file_name'], (row['size'], row['mtime_ns']))
+                          for row in self.connection.execute('SELECT file_name, size, mtime_ns FROM posts'))
+        blogs = list_blog_files(self.blog_path)
+        scanned_count = 0
+        with self.connection:
+            for blog in blogs:
+                file_path = os.path.join(self.blog_path, blog)
+                stat = os.stat(file_path)
+                if catalogued.get(blog) != (stat.st_size, stat.st_mtime_ns):
+                    self._scan_post(file_path, stat)
+                    scanned_count += 1
+            removed = set(catalogued) - set(blogs)
+            for file_name in removed:
+                self.connection.execute('DELETE FROM posts WHERE file_name = ?', (file_name,))
+                self.connection.execute('DELETE FROM post_images WHERE file_name = ?', (file_name,))
+            img_folders = []
+            for blog in blogs:
+                post_title = get_post_title(blog) if POST_DATE_PATTERN.match(blog) else os.path.splitext(blog)[0]
+                img_folders.append((index.find_folder(post_title), blog))
+            self.connection.executemany('UPDATE posts SET img_folder = ? WHERE file_name = ?', img_folders)
+            self.connection.execute('DELETE FROM img_folders')
+            self.connection.executemany('INSERT INTO img_folders VALUES (?, ?)',
+                                        [(folder, len(index.get_images(folder))) for folder in index.folders])
+            image_names = set()
+            images_path = os.path.join(self.blog_path, 'images')
+            for folder_path in (images_path, os.path.join(images_path, OPTIMIZED_FOLDER_NAME)):
+                if os.path.isdir(folder_path):
+                    with os.scandir(folder_path) as it:
+                        image_names.update(entry.name for entry in it if entry.is_file())
+            self.connection.execute('DELETE FROM images')
+            self.connection.executemany('INSERT INTO images VALUES (?)', [(name,) for name in image_names])
+        return scanned_count, len(removed)
+
+    def get_post(self, file_path):
+        """
+        :param file_path: The .md file path
+        :return: The catalogued post as sqlite3.Row, None if it's not catalogued or changed since
+        """
+        row = self.connection.execute('SELECT * FROM posts WHERE file_name = ?',
+                                      (os.path.basename(file_path),)).fetchone()
+        if row is None:
+            return None
+        stat = os.stat(file_path)
+        if (row['size'], row['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return row
+
+    def rename(self, file_name, new_file_name):
+        """
+        Record the new name of a renamed post, the date is found in the new file name.
+        """
+        date_match = POST_DATE_PATTERN.match(new_file_name)
+        with self.connection:
+            self.connection.execute('DELETE FROM posts WHERE file_name = ?', (new_file_name,))
+            self.connection.execute('DELETE FROM post_images WHERE file_name = ?', (new_file_name,))
+            self.connection.execute('UPDATE posts SET file_name = ?, date = COALESCE(?, date) WHERE file_name = ?',
+                                    (new_file_name, date_match.group(1) if date_match else None, file_name))
+            self.connection.execute('UPDATE post_images SET file_name = ? WHERE file_name = ?',
+                                    (new_file_name, file_name))
+
+    def list_posts_by_date(self):
+        """
+        :return: List of (date, file_name, title, author) of the posts, oldest first, posts without date last
+        """
+        return self.connection.execute('SELECT date, file_name, title, author FROM posts '
+                                       'ORDER BY date IS NULL, date, file_name').fetchall()
+
+    def list_missing_images(self):
+        """
+        Images are missing when a final image link points at an image which is not in the 'images' folder, or when
+        the img folder of a post has less images than the post has image links.
+        :return: List of (file_name, position, link) of the missing images
+        """
+        return self.connection.execute(
+            "SELECT l.file_name, l.position, l.link FROM post_images l JOIN posts p ON p.file_name = l.file_name "
+            "LEFT JOIN img_folders f ON f.name = p.img_folder "
+            "WHERE (l.link LIKE '/assets/images/%' AND l.image_name NOT IN (SELECT name FROM images)) "
+            "OR (l.link NOT LIKE '/assets/images/%' AND l.link NOT LIKE 'http%' "
+            "AND l.position >= COALESCE(f.image_count, 0)) "
+            "ORDER BY l.file_name, l.position").fetchall()
+
+    def list_posts_with_safelinks(self):
+        """
+        :return: List of (file_name, safelink_count) of the posts which still have internal links
+        """
+        return self.connection.execute('SELECT file_name, safelink_count FROM posts WHERE safelink_count > 0 '
+                                       'ORDER BY file_name').fetchall()
+
+
+BlogResult = namedtuple('BlogResult', ['file_name', 'output', 'error', 'record', 'stats', 'catalog_entry'])
+
+
+def process_blog(file_path, passes):
+    """
+    This function will run the pipeline for one .md file, and capture its output and error instead of printing them,
+    so that posts processed in parallel can be reported in order.
     :param file_path: The .md file path
-    :param target_jekyll_img_folder: The target img folder in Jekyll site
-    :return:
+    :param passes: Ordered list of transform passes, each pass accepts a BlogDocument
+    :return: BlogResult of the .md file
     """
-    file_name = os.path.basename(file_path)
-    base_path = os.path.dirname(file_path)
-    img_list = get_img_list(file_path)
-    # Replace image link in .md file with desired format
-    with open(file_path, 'r', encoding='utf-8') as f:
-        file_lines = f.readlines()
-        pattern = re.compile(r'/image', re.IGNORECASE)
-        match_count = 0
-        matched_line_num = []
+    output = io.StringIO()
+    error = None
+    record = None
+    stats = {}
+    catalog_entry = None
+    with redirect_stdout(output):
         try:
-            for i in range(0, len(file_lines)):
-                rest = pattern.findall(file_lines[i])
-                if len(rest) != 0:  # match found
-                    match_count += 1
-                    matched_line_num.append(i)
-            # Only rename and copy images when match_count = image count
-            if match_count != len(img_list):
-                print('Error occurred! Img matched count in .md file not equal with img count. Will not perform image '
-                      'rename, copy and modify image link in .md file.\nmd file name: {0}\nmatch_count in md: {1}\n'
-                      'img count in image folder: {2}'.format(file_name, match_count, len(img_list)))
-                print('======================================')
-            else:
-                rename_img_file(file_path)
-                img_list_after_rename = get_img_list(file_path)
-                img_list_after_rename.sort()
-                for i in range(0, len(matched_line_num)):
-                    file_lines[matched_line_num[i]] = "![{0}](/assets/images/{1}/{2})\n"\
-                        .format(str(i), target_jekyll_img_folder, img_list_after_rename[i])
-        except IndexError as e:
-            blog_name = os.path.basename(file_path)
-            print("Failed to modify image link for blog: {0}\nLine_No: {1}".format(blog_name, str(i+1)))
-            print(e)
-    # Write changes to the .md file, only do this when match found
-    try:
-        if match_count > 0 and (match_count == len(img_list)):
-            with open(file_path, 'w', encoding='utf-8') as f:
-                for data in file_lines:
-                    f.write(data)
-                f.flush()
-    except Exception as e:
-        print(e)
+            document = run_pipeline(file_path, passes)
+            stats = document.stats
+            # The saved post is still in memory, so the catalog doesn't need to read it again
+            catalog_entry = scan_post_lines(document.file_name, document.lines, os.stat(file_path))
+            # Posts with warnings are not done, e.g. their image links have not been modified, they are processed
+            # again by the next run
+            if not stats['warnings']:
+                record = build_post_record(file_path)
+        except PipelineStageError as e:
+            error = str(e)
+            stats = e.stats
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+    return BlogResult(os.path.basename(file_path), output.getvalue(), error, record, stats, catalog_entry)
 
 
-if __name__ == '__main__':
-    # Ask for a path contains the .md files and image folders, also prompt to enter a target Jekyll image folder.
-    while True:
-        blog_path = input("Please enter the path contains the .md files and img folders:")
-        jekyll_img_folder_name = input("Please enter the target jekyll site image folder name:")
-        if not os.path.exists(blog_path):
-            print("The path does not exists, please enter a valid path.")
-            os.system('cls')
-        else:
-            break
-    header_template_path = "D:\\AADProjects\\SharedDocs\\Post_header_template.txt"  # This path can be changes as need
-    print("Start doing blog content automation...")
-    print("======================================")
-    print("Start rename blog files...")
-    rename_file(blog_path)
-    if not os.path.exists(os.path.join(blog_path, 'images')):
-        os.makedirs(os.path.join(blog_path, 'images'))
-    item_list = os.listdir(blog_path)
-    blogs = []
-    try:
-        print("Start modifying blog header, rename image files, copy images to 'images' folder, remove internal links, "
-              "remove start angle brackets, and modify image links...")
-        for i in item_list:
-            file_ext = os.path.splitext(i)[1]
-            if os.path.isfile(os.path.join(blog_path, i)) and "md" in file_ext:
-                blogs.append(i)
-        for blog_item in blogs:
-            blog_item_path = os.path.join(blog_path, blog_item)
-            modify_blog_header(header_template_path, blog_item_path)
-            remove_internal_links(blog_item_path)
-            remove_start_brackets(blog_item_path)
-            modify_image_link(blog_item_path, jekyll_img_folder_name)
-        print("Successfully completed all work!")
-    except Exception as e:
-        print(e)
+def _init_worker(img_folder_indexes):
+    _img_folder_indexes.update(img_folder_indexes)
+
+
+def process_blogs(blog_paths, passes, jobs=1):
+    """
+    This function will run the pipeline for all .md files, across a process pool when jobs > 1.
+    :param blog_paths: List of .md file paths
+    :param passes: Ordered list of transform passes, each pass accepts a BlogDocument
+    :param jobs: Number of worker processes, 0 means the number of CPUs
+    :return: Generator of BlogResult, in the same order as blog_paths
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(blog_paths) <= 1:
+        for blog_path in blog_paths:
+            yield process_blog(blog_path, passes)
+        return
+    # Workers start with the img folder indexes of this process, so they don't scan the folders and hash the images
+    # again
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(_img_folder_indexes,)) as executor:
+        chunk_size = max(1, len(blog_paths) // (jobs * 4))
+        for result in executor.map(process_blog, blog_paths, [passes] * len(blog_paths), chunksize=chunk_size):
+            yield result
 
 
+def record_results(results, manifest):
+    """
+    This function will record the successfully processed .md files in the manifest, while passing the results through
+    :param results: Iterable of BlogResult
+    :param manifest: BlogManifest
+    :return: Generator of BlogResult
+    """
+    for result in results:
+        if result.record is not None:
+            manifest.record(result.file_name, result.record)
+        yield result
+
+
+def print_report(results):
+    """
+    This function will print the output of each .md file in order, followed by a summary of the failed ones and of
+    the ones with warnings.
+    :param results: Iterable of BlogResult
+    :return: List of BlogResult which failed or have warnings, i.e. which are not done
+    """
+    total_count = 0
+    warned = []
+    failed = []
+    rule_hits = {}
+    for result in results:
+        total_count += 1
+        if result.error is None and result.stats.get('warnings'):
+            warned.append(result)
+        for name, hits in result.stats.get('rule_hits', {}).items():
+            rule_hits[name] = rule_hits.get(name, 0) + hits
+        print(result.output, end='')
+        if result.error is not None:
+            failed.append(result)
+            print("Failed to process blog: {0}\n{1}".format(result.file_name, result.error))
+            print("======================================")
+    print("Processed {0} blogs, {1} failed.".format(total_count, len(failed)))
+    if warned:
+        print("{0} blogs have warnings, they will be processed again by the next run.".format(len(warned)))
+    if rule_hits:
+        print("Rewrite rule hits: {0}".format(', '.join('{0}={1}'.format(name, hits)
+                                                         for name, hits in sorted(rule_hits.items()))))
+    for result in failed:
+        print("  {0}: {1}".format(result.file_name, result.error))
+    for result in warned:
+        print("  {0}: {1}".format(result.file_name, ' '.join(result.stats['warnings'])))
+    return failed + warned
+
+
+def keep_results(results, kept_results):
+    """
+    This function will append the results to kept_results, while passing them through
+    :param results: Iterable of BlogResult
+    :param kept_results: List to append the results to
+    :return: Generator of BlogResult
+    """
+    for result in results:
+        kept_results.append(result)
+        yield result
+
+
+@contextmanager
+def timed_stage(run_stages, stage_name):
+    """
+    Time a stage of the whole run, e.g. renaming the files or publishing the images, and append its record to
+    run_stages.
+    """
+    start = time.perf_counter()
+    record = {'stage': stage_name, 'outcome': 'error'}
+    try:
+        yield
+        record['outcome'] = 'ok'
+    except Exception as e:
+        record['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        raise RunStageError(stage_name, e)
+    finally:
+        record['duration'] = time.perf_counter() - start
+        run_stages.append(record)
 
 
+def build_run_report(blog_path, results, run_stages):
+    """
+    This function will build the run report: the run stages, and for each post its outcome, duration, counters,
+    rewrite rule hits and stage records.
+    :param blog_path: The path contains the .md files and img folders
+    :param results: List of BlogResult
+    :param run_stages: List of the run stage records
+    :return: dict of the report
+    """
+    posts = []
+    for result in results:
+        stats = result.stats
+        if result.error is not None:
+            outcome = 'error'
+        elif stats.get('warnings'):
+            outcome = 'warning'
+        else:
+            outcome = 'ok'
+        post = {'post': result.file_name, 'outcome': outcome, 'error': result.error,
+                'duration': stats.get('duration', sum(stage['duration'] for stage in stats.get('stages', []))),
+                'warnings': stats.get('warnings', []), 'rule_hits': stats.get('rule_hits', {}),
+                'stages': stats.get('stages', [])}
+        for counter in STAGE_COUNTERS:
+            post[counter] = stats.get(counter, 0)
+        posts.append(post)
+    return {'blog_path': os.path.abspath(blog_path), 'pipeline_version': PIPELINE_VERSION,
+            'duration': sum(stage['duration'] for stage in run_stages), 'run_stages': run_stages, 'posts': posts}
+
+
+def write_run_report(report, report_path):
+    """
+    This function will write the run report as json, or as ndjson when the file extension is .ndjson or .jsonl. The
+    ndjson report has one line per run stage, per post stage and per post, with a 'type' key, and ends with the run.
+    :param report: dict of the report
+    :param report_path: The report file path
+    :return:
+    """
+    with open(report_path, 'w', encoding='utf-8') as f:
+        if not report_path.endswith(('.ndjson', '.jsonl')):
+            json.dump(report, f, indent=1)
+            return
+        for run_stage_record in report['run_stages']:
+            f.write(json.dumps(dict(run_stage_record, type='run_stage')) + '\n')
+        for post in report['posts']:
+            for stage_record in post['stages']:
+                f.write(json.dumps(dict(stage_record, type='stage', post=post['post'])) + '\n')
+            f.write(json.dumps(dict(((key, value) for key, value in post.items() if key != 'stages'),
+                                    type='post')) + '\n')
+        f.write(json.dumps({'type': 'run', 'blog_path': report['blog_path'],
+                            'pipeline_version': report['pipeline_version'], 'duration': report['duration'],
+                            'post_count': len(report['posts'])}) + '\n')
+
+
+def print_timing_summary(report, top=10):
+    """
+    This function will print the time spent per stage over all posts, the slowest posts and the run stages
+    :param report: dict of the report
+    :param top: Number of slowest posts to print
+    :return:
+    """
+    stage_totals = {}
+    for post in report['posts']:
+        for stage_record in post['stages']:
+            total = stage_totals.setdefault(stage_record['stage'], {'count': 0, 'duration': 0.0, 'max': 0.0,
+                                                                    'bytes_read': 0, 'bytes_written': 0,
+                                                                    'matches': 0, 'problems': 0})
+            total['count'] += 1
+            total['duration'] += stage_record['duration']
+            total['max'] = max(total['max'], stage_record['duration'])
+            for counter in STAGE_COUNTERS:
+                total[counter] += stage_record.get(counter, 0)
+            if stage_record['outcome'] != 'ok':
+                total['problems'] += 1
+    print("======================================")
+    print('{0:<22} {1:>7} {2:>10} {3:>9} {4:>9} {5:>12} {6:>13} {7:>8} {8:>8}'.format(
+        'stage', 'posts', 'total (s)', 'mean(ms)', 'max(ms)', 'bytes read', 'bytes written', 'matches', 'problems'))
+    for stage_name, total in sorted(stage_totals.items(), key=lambda item: -item[1]['duration']):
+        print('{0:<22} {1:>7} {2:>10.3f} {3:>9.2f} {4:>9.2f} {5:>12} {6:>13} {7:>8} {8:>8}'.format(
+            stage_name, total['count'], total['duration'], total['duration'] * 1000 / total['count'],
+            total['max'] * 1000, total['bytes_read'], total['bytes_written'], total['matches'], total['problems']))
+    print("Slowest posts:")
+    for post in sorted(report['posts'], key=lambda item: -item['duration'])[:top]:
+        slowest_stage = max(post['stages'], key=lambda item: item['duration'])['stage'] if post['stages'] else '-'
+        print('  {0:>9.2f}ms {1:<8} slowest stage: {2:<20} {3}'.format(post['duration'] * 1000, post['outcome'],
+                                                                        slowest_stage, post['post']))
+    print("Run stages:")
+    for run_stage_record in report['run_stages']:
+        print('  {0:>9.3f}s {1}'.format(run_stage_record['duration'], run_stage_record['stage']))
+
+
+def modify_blog_header(template_path, file_path):
+    """
+    This function will modify the blog header with the jekyll post header template.
+    :param template_path: The path contain the Jekyll post header template
+    :param file_path: The .md file path
+    :return:
+    """
+    # Posts with the Jekyll header already are not modified, no need to read them in full
+    if read_post_metadata(file_path).front_matter:
+        return
+    run_pipeline(file_path, [partial(modify_blog_header_pass, template_path=template_path)])
+
+
+def remove_internal_links(file_path):
+    """
+    This function will remove the internal links start with https://nam06...
+    :param file_path: The .md file path
+    :return:
+    """
+    run_pipeline(file_path, [INTERNAL_LINK_ENGINE])
+
+
+def remove_start_brackets(file_path):
+    """
+    This function will remove the '>' at the beginning of a line
+    :param file_path: The .md file path
+    :return:
+    """
+    run_pipeline(file_path, [START_BRACKET_ENGINE])
+
+
+IMG_FILE_EXTS = ['.jpg', '.gif', '.png']
+
+
+def normalize_title(title):
+    """
+    This function will normalize a post title or img folder name for matching, '-' is treated as space
+    :param title: Post title or img folder name
+    :return: Normalized title
+    """
+    return title.replace("-", " ").casefold()
+
+
+class ImgFolderIndex(object):
+    """
+    Index of the img folders within the path contains the .md files, built once with os.scandir.
+    Maps the img folder names to their image files, so that the stages look up a post's images without listing the
+    directory again.
+    """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        # img folder name -> list of image file names
+        self.folders = {}
+        self._folder_cache = {}
+        # Lookup tables of find_folder, built once from the img folder names
+        self._folder_keys = None
+        # Set together by _build_stored_names
+        self._dedup_map = None
+        self._stored_names = None
+        self._stale_names = None
+        # image path -> (size, mtime_ns, sha256) of the images hashed before, see add_known_hashes
+        self._known_hashes = {}
+        with os.scandir(base_path or '.') as it:
+            for entry in it:
+                if entry.name != 'images' and entry.is_dir():
+                    self.folders[entry.name] = self._scan_img_files(entry.path)
+
+    @staticmethod
+    def _scan_img_files(folder_path):
+        with os.scandir(folder_path) as it:
+            return [entry.name for entry in it if os.path.splitext(entry.name)[1] in IMG_FILE_EXTS]
+
+    def _build_folder_keys(self):
+        """
+        Normalize the img folder names once. Returns (exact, prefix, folder keys): exact maps a normalized folder name
+        to the folder, prefix maps every leading part of a normalized folder name followed by a non alphanumeric
+        char (e.g. the title of 'Title_files') to the folder, the shortest folder wins in both.
+        """
+        exact = {}
+        prefix = {}
+        folder_keys = []
+        for folder in sorted(self.folders, key=lambda item: (len(item), item)):
+            folder_key = normalize_title(folder)
+            folder_keys.append((folder_key, folder))
+            exact.setdefault(folder_key, folder)
+            for i in range(1, len(folder_key)):
+                if not folder_key[i].isalnum():
+                    prefix.setdefault(folder_key[:i], folder)
+        self._folder_keys = (exact, prefix, folder_keys)
+
+    def find_folder(self, post_title):
+        """
+        Look up the img folder of a post. An img folder named exactly as the post title wins, then the shortest
+        folder which starts with the title followed by a non alphanumeric char (e.g. 'Title_files'), then the
+        shortest folder which contains the title. This keeps the match stable when one title is a substring of
+        another folder name. The first two are dict lookups, only the last one scans the img folders.
+        :param post_title: The post title
+        :return: img folder name, '' if not found
+        """
+        if post_title in self._folder_cache:
+            return self._folder_cache[post_title]
+        key = normalize_title(post_title)
+        if not key:
+            return ''
+        if self._folder_keys is None:
+            self._build_folder_keys()
+        exact, prefix, folder_keys = self._folder_keys
+        img_folder_name = exact.get(key) or prefix.get(key)
+        if img_folder_name is None:
+            # folder_keys is sorted shortest first
+            img_folder_name = next((folder for folder_key, folder in folder_keys if key in folder_key), '')
+        self._folder_cache[post_title] = img_folder_name
+        return img_folder_name
+
+    def get_images(self, img_folder_name):
+        """
+        :param img_folder_name: img folder name
+        :return: A copy of the image file list of the img folder
+        """
+        return list(self.folders.get(img_folder_name, []))
+
+    def rename_image(self, img_folder_name, old_name, new_name):
+        """
+        Keep the index in sync after an image file has been renamed on disk.
+        """
+        images = self.folders[img_folder_name]
+        images[images.index(old_name)] = new_name
+
+    def rescan_folder(self, img_folder_name):
+        """
+        Scan an img folder again after it has been created, modified or removed.
+        :param img_folder_name: img folder name
+        """
+        folder_path = os.path.join(self.base_path, img_folder_name)
+        if os.path.isdir(folder_path):
+            self.folders[img_folder_name] = self._scan_img_files(folder_path)
+        else:
+            self.folders.pop(img_folder_name, None)
+        self._folder_cache = {}
+        self._folder_keys = None
+        self._dedup_map = None
+
+    def get_renamed_images(self, img_folder_name):
+        """
+        :param img_folder_name: img folder name
+        :return: List of (image file name, image file name after rename_img_file) in sorted order
+        """
+        img_file_list = sorted(self.folders.get(img_folder_name, []))
+        return [(img, get_renamed_img_name(img_folder_name, img, i)) for i, img in enumerate(img_file_list)]
+
+    def add_known_hashes(self, known_hashes):
+        """
+        Reuse the hashes of the images which have been hashed before, e.g. recorded in the manifest, instead of
+        reading the images again. A hash is only used while the image keeps the recorded size and mtime.
+        :param known_hashes: dict image path -> (size, mtime_ns, sha256)
+        """
+        self._known_hashes.update(known_hashes)
+
+    def hash_image(self, img_path, stat):
+        """
+        :param img_path: The image path within an img folder
+        :param stat: os.stat_result of the image
+        :return: sha256 of the image, the known hash while the image keeps the recorded size and mtime
+        """
+        known_hash = self._known_hashes.get(img_path)
+        if known_hash is not None and tuple(known_hash[:2]) == (stat.st_size, stat.st_mtime_ns):
+            return known_hash[2]
+        return hash_file(img_path)
+
+    def _build_stored_names(self):
+        """
+        Decide the name of every image in 'images' folder. The images are grouped by size first, only the images
+        sharing a size with another image are hashed. Identical images are stored once, with the name of the first
+        one in (img folder, image) order. Different images whose renamed names collide (the renamed names keep only
+        the first 19 chars of the img folder name) are stored with a short content hash added to the name, except the
+        first one. A name already in 'images' folder stays with its content: the image with the same content gets
+        the name, the other images get the hashed name, also when they come first. When the stored image is an older
+        version of an image with this name, as recorded with the known hashes (e.g. the img folder has been exported
+        again with a changed image), the name stays with this image and the stored image is stale. The names only
+        depend on the img folders and 'images' folder, never on the order the posts are processed in.
+        """
+        # (img folder name, renamed image file name, image path) in (img folder, image) order
+        imgs = []
+        img_stats = {}
+        same_size_imgs = {}
+        for img_folder in sorted(self.folders):
+            for img, renamed_img in self.get_renamed_images(img_folder):
+                img_path = os.path.join(self.base_path, img_folder, img)
+                imgs.append((img_folder, renamed_img, img_path))
+                img_stats[img_path] = os.stat(img_path)
+                same_size_imgs.setdefault(img_stats[img_path].st_size, []).append(img_path)
+        # renamed image file name -> (img folder name, image path), to find the images whose name is taken in
+        # 'images' folder
+        renamed_imgs = {}
+        for img_folder, renamed_img, img_path in imgs:
+            renamed_imgs.setdefault(renamed_img, []).append((img_folder, img_path))
+        # image path -> content id, the image path itself when no other image has the same size
+        content_ids = {}
+        for img_paths in same_size_imgs.values():
+            for img_path in img_paths:
+                if len(img_paths) > 1:
+                    content_ids[img_path] = self.hash_image(img_path, img_stats[img_path])
+                else:
+                    content_ids[img_path] = img_path
+        # Stored name -> content id of the image stored in 'images' folder with this name, None when it's none of the
+        # images, e.g. an image which has been removed
+        name_contents = {}
+        self._stale_names = set()
+        images_path = os.path.join(self.base_path, 'images')
+        if os.path.isdir(images_path):
+            stored_imgs = set(os.listdir(images_path))
+            for renamed_img, img_items in renamed_imgs.items():
+                if renamed_img not in stored_imgs:
+                    continue
+                stored_path = os.path.join(images_path, renamed_img)
+                name_contents[renamed_img] = next((content_ids[img_path] for img_folder, img_path in img_items
+                                                   if is_same_file_content(img_path, stored_path)), None)
+                if name_contents[renamed_img] is not None:
+                    continue
+                for img_folder, img_path in img_items:
+                    known_hash = self._known_hashes.get(os.path.join(self.base_path, img_folder, renamed_img))
+                    if known_hash is not None and hash_file(stored_path) == known_hash[2]:
+                        name_contents[renamed_img] = content_ids[img_path]
+                        self._stale_names.add(renamed_img)
+                        break
+        dedup_map = {}
+        self._stored_names = {}
+        # content id -> stored name
+        content_names = {}
+        for img_folder, renamed_img, img_path in imgs:
+            content_id = content_ids[img_path]
+            stored_name = content_names.get(content_id)
+            if stored_name is not None:
+                dedup_map[(img_folder, renamed_img)] = stored_name
+            else:
+                stored_name = renamed_img
+                if name_contents.get(stored_name, content_id) != content_id:
+                    file_name, file_ext = os.path.splitext(renamed_img)
+                    img_hash = self.hash_image(img_path, img_stats[img_path])
+                    stored_name = '{0}_{1}{2}'.format(file_name, img_hash[:8], file_ext)
+                content_names[content_id] = stored_name
+                name_contents[stored_name] = content_id
+            if stored_name != renamed_img:
+                self._stored_names[(img_folder, renamed_img)] = stored_name
+        self._dedup_map = dedup_map
+
+    def get_dedup_map(self):
+        """
+        Find the identical images within and across the img folders, see _build_stored_names.
+        :return: dict (img folder name, renamed image file name) -> name of the identical image stored in 'images'
+            folder, only for the images which duplicate another one
+        """
+        if self._dedup_map is None:
+            self._build_stored_names()
+        return self._dedup_map
+
+    def reset_stored_names(self):
+        """
+        Decide the stored names again on next use, e.g. after images have been written to 'images' folder.
+        """
+        self._dedup_map = None
+
+    def is_stale_image(self, stored_name):
+        """
+        :param stored_name: The image file name in 'images' folder
+        :return: True if the stored image is an older version of the image stored with this name, which replaces it
+        """
+        if self._dedup_map is None:
+            self._build_stored_names()
+        return stored_name in self._stale_names
+
+    def get_canonical_image(self, img_folder_name, renamed_img):
+        """
+        :param img_folder_name: img folder name
+        :param renamed_img: image file name after rename_img_file
+        :return: The image file name stored in 'images' folder for this image
+        """
+        if self._dedup_map is None:
+            self._build_stored_names()
+        return self._stored_names.get((img_folder_name, renamed_img), renamed_img)
+
+
+_img_folder_indexes = {}
+
+
+def get_img_folder_index(base_path, refresh=False):
+    """
+    This function will return the img folder index of the path, the index is built once and cached per process
+    :param base_path: The path contains the .md files and img folders
+    :param refresh: Rebuild the index even if it has been cached
+    :return: ImgFolderIndex
+    """
+    base_path = os.path.abspath(base_path)
+    if refresh or base_path not in _img_folder_indexes:
+        _img_folder_indexes[base_path] = ImgFolderIndex(base_path)
+    return _img_folder_indexes[base_path]
+
+
+def get_renamed_img_name(img_folder_name, img_file_name, position):
+    """
+    This function will return the image file name after rename_img_file, 'first 20 chars of post name + _image00x'
+    :param img_folder_name: img folder name
+    :param img_file_name: image file name
+    :param position: Position of the image in the sorted image list of the img folder
+    :return: Renamed image file name, the same name if it already has been renamed
+    """
+    if img_file_name[:5] != 'image':
+        return img_file_name
+    file_ext = os.path.splitext(img_file_name)[1]
+    return img_folder_name.replace(" ", "_")[0:19] + '_image0' + str(position+1).zfill(2) + file_ext
+
+
+def get_post_title(file_path):
+    """
+    This function will return the post title from a renamed .md file path 'Year-Month-Day-File-Name.md'
+    :param file_path: .md file path
+    :return: post title
+    """
+    file_name = os.path.basename(file_path)
+    file_name_list = file_name.split('-')[3:]
+    separator = ' '
+    return separator.join(file_name_list).replace(".md", "")
+
+
+def get_img_folder_name(file_path):
+    """
+    This function will return the img folder name of input post by accepting the .md file path
+    :param file_path: .md file path
+    :return: img folder name
+    """
+    index = get_img_folder_index(os.path.dirname(file_path))
+    return index.find_folder(get_post_title(file_path))
+
+
+def get_img_list(file_path):
+    """
+    This function will return the img list of input post by accepting the .md file path
+    :param file_path: .md file path
+    :return: img list
+    """
+    index = get_img_folder_index(os.path.dirname(file_path))
+    return index.get_images(index.find_folder(get_post_title(file_path)))
+
+
+# Linux ioctl to clone a file's extents (reflink) on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def copy_file_data(src, dst):
+    """
+    This function will copy the content of the opened src file to the opened dst file, by reflink when the filesystem
+    supports it, otherwise in kernel with os.copy_file_range/os.sendfile, and by read/write as the last resort.
+    :param src: Source file object opened in binary read mode
+    :param dst: Target file object opened in binary write mode
+    :return:
+    """
+    try:
+        import fcntl
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    size = os.fstat(src.fileno()).st_size
+    for copy_func in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+        if copy_func is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if copy_func is os.sendfile:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                else:
+                    sent = os.copy_file_range(src.fileno(), dst.fileno(), size - offset, offset, offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError as e:
+            # Nothing written yet, try the next way; otherwise give up with the error
+            if offset != 0 or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP,
+                                              errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK):
+                raise
+    src.seek(0)
+    copyfileobj(src, dst)
+
+
+def clone_file(src_path, dst_path, allow_hardlink=True):
+    """
+    This function will create dst_path with the content of src_path. A hardlink is made when both are on the same
+    filesystem, otherwise the file is reflinked or copied. dst_path must not exist.
+    :param src_path: The source file path
+    :param dst_path: The target file path
+    :param allow_hardlink: Make a hardlink when possible
+    :return: True if a hardlink has been made, otherwise False
+    """
+    if allow_hardlink:
+        try:
+            os.link(src_path, dst_path)
+            return True
+        except FileExistsError:
+            raise
+        except (OSError, NotImplementedError):
+            # Different filesystem or hardlink not supported
+            pass
+    dst = open(dst_path, 'xb')
+    try:
+        with dst, open(src_path, 'rb') as src:
+            copy_file_data(src, dst)
+        src_stat = os.stat(src_path)
+        os.utime(dst_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    except BaseException:
+        os.remove(dst_path)
+        raise
+    return False
+
+
+def copy_img_if_absent(copy_src, copy_dst, conflicts=None):
+    """
+    This function will copy the image file to copy_dst only if copy_dst does not exist. The target file is created
+    exclusively, so posts processed in parallel never overwrite each other in the shared 'images' folder.
+    The image is hardlinked instead of copied when possible.
+    :param copy_src: The source image path
+    :param copy_dst: The target image path
+    :param conflicts: List to add the target image name to when it exists with a different content, None to not
+    :return: True if the image data has been copied, False if the image has been hardlinked or copy_dst exists
+    """
+    try:
+        hardlinked = clone_file(copy_src, copy_dst)
+    except FileExistsError:
+        if not is_same_file_content(copy_src, copy_dst):
+            print("Target img file with name {0} already exists in 'images' folder with different content!"
+                  .format(os.path.basename(copy_dst)))
+            if conflicts is not None:
+                conflicts.append(os.path.basename(copy_dst))
+        return False
+    return not hardlinked
+
+
+def is_same_file_content(src_path, dst_path):
+    """
+    This function will check whether dst_path already has the content of src_path. The files are the same when they
+    are the same inode, or have the same size and mtime; when only the mtime differs the content hash decides.
+    :param src_path: The source file path
+    :param dst_path: The target file path
+    :return: True if the content is the same
+    """
+    src_stat = os.stat(src_path)
+    try:
+        dst_stat = os.stat(dst_path)
+    except FileNotFoundError:
+        return False
+    if os.path.samestat(src_stat, dst_stat):
+        return True
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    return hash_file(src_path) == hash_file(dst_path)
+
+
+def replace_file_if_changed(src_path, dst_path):
+    """
+    This function will make dst_path a copy of src_path unless it has the same content already. The copy is
+    hardlinked when on the same filesystem, otherwise reflinked or copied, and replaces the target file atomically.
+    :param src_path: The source file path
+    :param dst_path: The target file path
+    :return: True if the target file has been replaced, False if it was the same
+    """
+    if is_same_file_content(src_path, dst_path):
+        return False
+    dst_folder, dst_name = os.path.split(dst_path)
+    tmp_path = os.path.join(dst_folder, '.{0}.{1}.tmp'.format(dst_name, os.getpid()))
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        clone_file(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+# Image formats published to the Jekyll site, WebP is written by the image optimization only
+PUBLISHED_IMG_FILE_EXTS = IMG_FILE_EXTS + ['.webp']
+
+
+def publish_images(images_path, jekyll_site_path, target_jekyll_img_folder):
+    """
+    This function will sync the images in 'images' folder to /assets/images/<target_jekyll_img_folder> of the Jekyll
+    site. Images already in the site with the same content are skipped, the others are hardlinked when the site is on
+    the same filesystem, otherwise reflinked or copied, and replace the target file atomically.
+    :param images_path: The 'images' folder path, or its 'optimized' folder when the images are optimized
+    :param jekyll_site_path: The Jekyll site path
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :return: (published image count, skipped image count)
+    """
+    target_path = os.path.join(jekyll_site_path, 'assets', 'images', target_jekyll_img_folder)
+    os.makedirs(target_path, exist_ok=True)
+    published_count = 0
+    skipped_count = 0
+    with os.scandir(images_path) as it:
+        img_entries = [entry for entry in it
+                       if entry.is_file() and os.path.splitext(entry.name)[1] in PUBLISHED_IMG_FILE_EXTS]
+    for entry in img_entries:
+        if replace_file_if_changed(entry.path, os.path.join(target_path, entry.name)):
+            published_count += 1
+        else:
+            skipped_count += 1
+    return published_count, skipped_count
+
+
+# Settings of the image optimization. max_width: images wider are resized, None to keep the size. quality: quality of
+# the JPEG and WebP images, 1 to 100. webp: convert the images to WebP. responsive_widths: widths of the smaller
+# variants referenced by the srcset of the image links.
+ImageOptimizeSettings = namedtuple('ImageOptimizeSettings', ['max_width', 'quality', 'webp', 'responsive_widths'])
+# Change it when the encoding changes, so the images are optimized again instead of taken from the cache
+IMG_OPTIMIZER_VERSION = '2'
+OPTIMIZED_FOLDER_NAME = 'optimized'
+IMG_CACHE_FOLDER_NAME = '.cache'
+IMG_HASHES_FILE_NAME = 'hashes.json'
+
+
+def get_img_settings_key(img_settings):
+    """
+    :param img_settings: ImageOptimizeSettings
+    :return: Short hash of the settings and the optimizer version, which names the cached images
+    """
+    settings = [IMG_OPTIMIZER_VERSION, img_settings.max_width, img_settings.quality, bool(img_settings.webp),
+                sorted(img_settings.responsive_widths)]
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+
+def get_img_width(img_path):
+    """
+    This function will read the width of the image from its header, the image is not decoded
+    :param img_path: The image path
+    :return: The width of the image as displayed, i.e. after the EXIF orientation, None if Pillow can't read it
+    """
+    try:
+        with Image.open(img_path) as image:
+            width, height = image.size
+            # EXIF orientations 5 to 8 rotate the image by 90 degrees
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width = height
+            return width
+    except IMG_ERRORS:
+        return None
+
+
+def is_img_kept_as_is(img_file_name, img_width):
+    """
+    :return: True if the image is not optimized, GIF images as they may be animated, and images Pillow can't read
+    """
+    return img_width is None or os.path.splitext(img_file_name)[1].lower() == '.gif'
+
+
+def get_optimized_img_names(img_file_name, img_settings, img_width):
+    """
+    This function will return the names of the optimized images of an image, with their widths. The images are never
+    upscaled, so only the responsive widths narrower than the optimized image have a variant.
+    :param img_file_name: The image file name in 'images' folder
+    :param img_settings: ImageOptimizeSettings
+    :param img_width: The width of the image, see get_img_width
+    :return: (name of the optimized image, its width, list of (width, name) of the responsive variants, narrowest
+        first). (img_file_name, img_width, []) when the image is kept as it is.
+    """
+    if is_img_kept_as_is(img_file_name, img_width):
+        return img_file_name, img_width, []
+    file_name, file_ext = os.path.splitext(img_file_name)
+    if img_settings.webp:
+        file_ext = '.webp'
+    optimized_width = min(img_width, img_settings.max_width) if img_settings.max_width else img_width
+    widths = sorted(set(width for width in img_settings.responsive_widths if width < optimized_width))
+    return file_name + file_ext, optimized_width, [(width, '{0}-{1}w{2}'.format(file_name, width, file_ext))
+                                                   for width in widths]
+
+
+def format_img_link(position, target_jekyll_img_folder, img_path, img_settings=None):
+    """
+    This function will return the markdown image link, like ![1](/assets/images/img_folder/image.jpg). With
+    responsive variants, their srcset is added as a kramdown attribute list, like {: srcset="..."}.
+    :param position: The position of the image in the post
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :param img_path: The image path in 'images' folder
+    :param img_settings: ImageOptimizeSettings to link to the optimized images, None to link to the image as it is
+    :return: The image link
+    """
+    url_path = '/assets/images/{0}/'.format(target_jekyll_img_folder)
+    img_file_name = os.path.basename(img_path)
+    if img_settings is None:
+        return '![{0}]({1}{2})'.format(position, url_path, img_file_name)
+    optimized_name, optimized_width, variants = get_optimized_img_names(img_file_name, img_settings,
+                                                                        get_img_width(img_path))
+    img_link = '![{0}]({1}{2})'.format(position, url_path, optimized_name)
+    if variants:
+        srcset = ['{0}{1} {2}w'.format(url_path, name, width) for width, name in variants]
+        srcset.append('{0}{1} {2}w'.format(url_path, optimized_name, optimized_width))
+        img_link += '{: srcset="' + ', '.join(srcset) + '"}'
+    return img_link
+
+
+def save_optimized_img(image, width, file_path, quality):
+    """
+    This function will save the image resized to width, in the format of the file extension
+    :param image: The PIL image, without metadata
+    :param width: The maximum width, None to keep the size
+    :param file_path: The target file path, ending with .jpg, .png or .webp
+    :param quality: Quality of the JPEG and WebP images
+    :return:
+    """
+    if width and image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    file_ext = os.path.splitext(file_path)[1].lower()
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if file_ext == '.webp':
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        image.save(file_path, 'WEBP', quality=quality, method=6)
+    elif file_ext == '.jpg':
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(file_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(file_path, 'PNG', optimize=True)
+
+
+def get_cached_img_names(img_file_name, img_settings, img_width):
+    """
+    The cached images are named after the content, not after the image, so identical images share them.
+    :return: Names of the optimized image and of its responsive variants in the cache folder of the image
+    """
+    names = get_optimized_img_names('image' + os.path.splitext(img_file_name)[1].lower(), img_settings, img_width)
+    return [names[0]] + [name for _, name in names[2]]
+
+
+def optimize_image(src_path, cache_path, img_settings, img_width):
+    """
+    This function will write the optimized image and its responsive variants to the cache_path folder. The images are
+    written to a temporary folder renamed to cache_path once complete, so the cache never holds partial results.
+    :param src_path: The image path in 'images' folder
+    :param cache_path: The cache folder of the image content and the settings
+    :param img_settings: ImageOptimizeSettings
+    :param img_width: The width of the image, see get_img_width
+    :return: Bytes of the optimized images
+    """
+    optimized_width, variants = get_optimized_img_names(os.path.basename(src_path), img_settings, img_width)[1:]
+    cache_names = get_cached_img_names(src_path, img_settings, img_width)
+    cache_folder = os.path.dirname(cache_path)
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.' + os.path.basename(cache_path), suffix='.tmp', dir=cache_folder)
+    try:
+        with Image.open(src_path) as image:
+            image = ImageOps.exif_transpose(image)
+            # Strip the metadata (exif, icc profile, comments), only the transparency is kept
+            image.info = {key: value for key, value in image.info.items() if key == 'transparency'}
+            widths = [optimized_width] + [width for width, _ in variants]
+            for width, name in zip(widths, cache_names):
+                save_optimized_img(image, width, os.path.join(tmp_path, name), img_settings.quality)
+        optimized_bytes = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # Optimized by another run meanwhile
+            if not os.path.isdir(cache_path):
+                raise
+            rmtree(tmp_path)
+    except BaseException:
+        rmtree(tmp_path, ignore_errors=True)
+        raise
+    return optimized_bytes
+
+
+def read_img_hashes(cache_root):
+    """
+    :param cache_root: The cache folder of the optimized images
+    :return: dict image file name -> [size, mtime_ns, sha256, width] of the images hashed by the last run
+    """
+    try:
+        with open(os.path.join(cache_root, IMG_HASHES_FILE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_img_hashes(cache_root, img_hashes):
+    fd, tmp_path = tempfile.mkstemp(prefix=IMG_HASHES_FILE_NAME, suffix='.tmp', dir=cache_root)
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(img_hashes, f, sort_keys=True)
+        os.replace(tmp_path, os.path.join(cache_root, IMG_HASHES_FILE_NAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def place_optimized_images(img_path, cache_path, optimized_path, img_settings, img_width):
+    """
+    This function will link the cached optimized images to the 'optimized' folder, with the names the image links
+    use, see format_img_link. Without cached images, i.e. the image is kept as it is or failed to be optimized, the
+    image itself is linked with these names, so that every linked image is published.
+    :param img_path: The image path in 'images' folder
+    :param cache_path: The cache folder of the image content and the settings, None if the image is kept as it is
+    :param optimized_path: The 'optimized' folder path
+    :param img_settings: ImageOptimizeSettings
+    :param img_width: The width of the image, see get_img_width
+    :return: List of the optimized image names
+    """
+    img_file_name = os.path.basename(img_path)
+    optimized_name, _, variants = get_optimized_img_names(img_file_name, img_settings, img_width)
+    names = [optimized_name] + [name for _, name in variants]
+    if cache_path is not None and os.path.isdir(cache_path):
+        src_paths = [os.path.join(cache_path, name)
+                     for name in get_cached_img_names(img_file_name, img_settings, img_width)]
+    else:
+        src_paths = [img_path] * len(names)
+    for src_path, name in zip(src_paths, names):
+        replace_file_if_changed(src_path, os.path.join(optimized_path, name))
+    return names
+
+
+class _SerialExecutor(object):
+    """
+    Executor running the functions right away in this process, used when a process pool is not worth starting
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def optimize_images(images_path, img_settings, jobs=1):
+    """
+    This function will optimize the images in 'images' folder to its 'optimized' folder: resized to the maximum width,
+    recompressed, converted to WebP and with responsive variants as per the settings, without metadata. The results
+    are cached in the '.cache' folder by image content hash and settings, so unchanged images are never optimized
+    again, and the images are hashed again only when their size or mtime changed. GIF images and images Pillow can't
+    read are published as they are, images which fail to be optimized are published as they are with the names the
+    image links use.
+    :param images_path: The 'images' folder path
+    :param img_settings: ImageOptimizeSettings
+    :param jobs: Number of worker processes, 0 means the number of CPUs
+    :return: (optimized image count, image count taken from the cache)
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is needed to optimize the images, install it with 'pip install pillow'.")
+    optimized_path = os.path.join(images_path, OPTIMIZED_FOLDER_NAME)
+    cache_root = os.path.join(images_path, IMG_CACHE_FOLDER_NAME)
+    os.makedirs(optimized_path, exist_ok=True)
+    os.makedirs(cache_root, exist_ok=True)
+    settings_key = get_img_settings_key(img_settings)
+    last_img_hashes = read_img_hashes(cache_root)
+    img_hashes = {}
+    # (image path, cache folder or None if kept as it is, image width)
+    images = []
+    with os.scandir(images_path) as it:
+        img_entries = [entry for entry in it if entry.is_file() and os.path.splitext(entry.name)[1] in IMG_FILE_EXTS]
+    for entry in sorted(img_entries, key=lambda item: item.name):
+        stat = entry.stat()
+        img_hash = last_img_hashes.get(entry.name)
+        if img_hash is None or len(img_hash) != 4 or img_hash[:2] != [stat.st_size, stat.st_mtime_ns]:
+            img_hash = [stat.st_size, stat.st_mtime_ns, hash_file(entry.path), get_img_width(entry.path)]
+        img_hashes[entry.name] = img_hash
+        cache_path = None
+        if not is_img_kept_as_is(entry.name, img_hash[3]):
+            cache_path = os.path.join(cache_root, img_hash[2][:2], '{0}-{1}'.format(img_hash[2], settings_key))
+        images.append((entry.path, cache_path, img_hash[3]))
+    write_img_hashes(cache_root, img_hashes)
+
+    # Identical images are optimized once
+    missing = dict((cache_path, (img_path, img_width)) for img_path, cache_path, img_width in images
+                   if cache_path is not None and not os.path.isdir(cache_path))
+    failed_count = 0
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and len(missing) > 1 else _SerialExecutor() as executor:
+        futures = [(executor.submit(optimize_image, img_path, cache_path, img_settings, img_width), img_path)
+                   for cache_path, (img_path, img_width) in missing.items()]
+        for future, img_path in futures:
+            try:
+                future.result()
+            except IMG_ERRORS as e:
+                # The header can be read but not the image, e.g. a truncated file or too many pixels
+                failed_count += 1
+                print("Failed to optimize image {0}, publish it as it is: {1}".format(os.path.basename(img_path), e))
+
+    optimized_names = set()
+    for img_path, cache_path, img_width in images:
+        optimized_names.update(place_optimized_images(img_path, cache_path, optimized_path, img_settings, img_width))
+    # Remove the optimized images of the removed images, and of the previous settings
+    with os.scandir(optimized_path) as it:
+        for entry in it:
+            if entry.is_file() and entry.name not in optimized_names:
+                os.remove(entry.path)
+    return len(missing) - failed_count, len(images) - len(missing)
+
+
+def rename_img_file(file_path, conflicts=None):
+    """
+    This function will rename the image files from 'image00x' to 'first 20 chars of post name + _image00x'.
+    This will ensure image name is unique so that we can add it in to Jekyll blogs.
+    This function will also copy the image files into the images folder within path.
+    :param file_path: The .md file path
+    :param conflicts: List to add the names of the images which could not be copied to, because the images folder
+        has a different image with the same name. None to not
+    :return: Bytes of the images copied to the images folder
+    """
+    file_name = os.path.basename(file_path)
+    base_path = os.path.dirname(file_path)
+    copied_bytes = 0
+    index = get_img_folder_index(base_path)
+    img_folder = index.find_folder(get_post_title(file_path))
+    new_file_name = ''
+    try:
+        for img_file_name, new_file_name in index.get_renamed_images(img_folder):
+            # Don't rename the image file if its name not start with 'image', which means it already has been renamed.
+            if new_file_name != img_file_name:
+                # Rename the image file
+                os.rename(os.path.join(base_path, img_folder, img_file_name), os.path.join(base_path, img_folder,
+                                                                                           new_file_name))
+                index.rename_image(img_folder, img_file_name, new_file_name)
+            copy_src = os.path.join(base_path, img_folder, new_file_name)
+            # Identical images are stored once in 'images' folder, with the name of the canonical one
+            stored_name = index.get_canonical_image(img_folder, new_file_name)
+            copy_dst = os.path.join(base_path, 'images', stored_name)
+            if index.is_stale_image(stored_name):
+                # The image has changed since it has been stored, e.g. the img folder has been exported again
+                if replace_file_if_changed(copy_src, copy_dst) and not os.path.samefile(copy_src, copy_dst):
+                    copied_bytes += os.path.getsize(copy_dst)
+            # Copy image file to 'images' folder if image does not exist, also when the image file has been renamed
+            # by a previous run
+            elif copy_img_if_absent(copy_src, copy_dst, conflicts):
+                copied_bytes += os.path.getsize(copy_dst)
+        print("Rename and copy image files successfully! .md file name: {0}.".format(file_name))
+    except FileExistsError:
+        print("Target img file with name {0} already exists!".format(new_file_name))
+    print("======================================")
+    return copied_bytes
+
+
+def modify_image_link(file_path, target_jekyll_img_folder):
+    """
+    This function will modify the image links in .md file to format like ![1](/assets/images/img_folder/image.jpg)
+    :param file_path: The .md file path
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :return:
+    """
+    run_pipeline(file_path, [partial(modify_image_link_pass, target_jekyll_img_folder=target_jekyll_img_folder)])
+
+
+# Image formats of word/media which browsers display, with the extension used in the images folder
+DOCX_IMG_EXTS = {'.png': '.png', '.jpg': '.jpg', '.jpeg': '.jpg', '.gif': '.gif'}
+
+
+def write_img_stream(open_src, copy_dst, replaceable_sha256=None):
+    """
+    This function will write the image stream to copy_dst. The stream is written to a temp file next to copy_dst,
+    which replaces copy_dst atomically only when copy_dst has the content replaceable_sha256, e.g. the image has been
+    changed in the .docx file which wrote copy_dst. When copy_dst is another image, the image is written with a short
+    content hash added to the name, as _build_stored_names names the colliding images. The target is left untouched
+    when it has the same content, so its mtime and the files linked to it are kept.
+    :param open_src: Callable returning the image stream, opened in binary mode
+    :param copy_dst: The target image path
+    :param replaceable_sha256: sha256 of the image copy_dst may be replaced, None to replace no image
+    :return: (path of the image written or kept, sha256 of the image)
+    """
+    dst_folder, dst_name = os.path.split(copy_dst)
+    tmp_path = os.path.join(dst_folder, '.{0}.{1}.tmp'.format(dst_name, os.getpid()))
+    try:
+        sha256 = hashlib.sha256()
+        with open(tmp_path, 'wb') as dst, open_src() as src:
+            for chunk in iter(partial(src.read, 1024 * 1024), b''):
+                sha256.update(chunk)
+                dst.write(chunk)
+        img_hash = sha256.hexdigest()
+        dst_hash = hash_file(copy_dst) if os.path.exists(copy_dst) else None
+        if dst_hash is not None and dst_hash not in (img_hash, replaceable_sha256):
+            file_name, file_ext = os.path.splitext(copy_dst)
+            copy_dst = '{0}_{1}{2}'.format(file_name, img_hash[:8], file_ext)
+            dst_hash = hash_file(copy_dst) if os.path.exists(copy_dst) else None
+        if dst_hash == img_hash:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, copy_dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return copy_dst, img_hash
+
+
+def get_docx_md_names(docx_file_name):
+    """
+    :param docx_file_name: The .docx file name, the post title
+    :return: (.md file name written by ingest_docx, .md file name after rename_file without the 'Year-Month-Day-')
+    """
+    file_name = os.path.splitext(docx_file_name)[0]
+    return file_name + '.md', file_name.replace(" ", "-") + '.md'
+
+
+def find_docx_md_file(file_names, docx_file_name):
+    """
+    :param file_names: The file names in the path contains the .docx file
+    :param docx_file_name: The .docx file name
+    :return: The .md file name of the .docx file, renamed by rename_file or not, None if it has not been converted
+    """
+    md_file_name, renamed_file_name = get_docx_md_names(docx_file_name)
+    for item in sorted(file_names):
+        date_match = POST_DATE_PATTERN.match(item)
+        if item == md_file_name or (date_match and item[date_match.end():] == renamed_file_name):
+            return item
+    return None
+
+
+def ingest_docx(docx_path, target_jekyll_img_folder, img_settings=None, md_file_name=None, docx_images=None):
+    """
+    This function will convert the .docx file to a .md file next to it, replacing pandoc and the html image export.
+    The images are streamed from the .docx file straight to the 'images' folder, with the names rename_img_file would
+    give them, and the image links are written in their final format, in document order.
+    :param docx_path: The .docx file path
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :param img_settings: ImageOptimizeSettings to link to the optimized images, None to link to the images as they are
+    :param md_file_name: The .md file name to write, e.g. the .md file renamed by rename_file when the .docx file is
+        converted again, None for the .docx file name with .md
+    :param docx_images: dict image file name -> sha256 of the images this .docx file wrote to 'images' folder before,
+        only these images are replaced when they changed, other images with the same name are kept. Set to the
+        images written. None to replace no image
+    :return: The .md file path
+    """
+    base_path = os.path.dirname(docx_path)
+    docx_file_name = os.path.basename(docx_path)
+    if md_file_name is None:
+        md_file_name = get_docx_md_names(docx_file_name)[0]
+    # The img folder the html export would have created
+    img_folder_name = os.path.splitext(docx_file_name)[0] + '_files'
+    images_path = os.path.join(base_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
+    written_images = {}
+
+    def write_image(docx_zip, member_name, position):
+        member_ext = os.path.splitext(member_name)[1].lower()
+        if member_ext not in DOCX_IMG_EXTS:
+            print("Image {0} in {1} has format {2} which can't be displayed in browsers."
+                  .format(member_name, docx_file_name, member_ext))
+        img_file_name = 'image' + str(position+1).zfill(3) + DOCX_IMG_EXTS.get(member_ext, member_ext)
+        new_file_name = get_renamed_img_name(img_folder_name, img_file_name, position)
+        # The names keep only the first 19 chars of the .docx file name, an image of another .docx file or img folder
+        # may have the name already
+        img_path, img_hash = write_img_stream(partial(docx_zip.open, member_name),
+                                              os.path.join(images_path, new_file_name),
+                                              (docx_images or {}).get(new_file_name))
+        written_images[os.path.basename(img_path)] = img_hash
+        return img_path
+
+    def format_image(position, img_path):
+        return format_img_link(position, target_jekyll_img_folder, img_path, img_settings)
+
+    md_path = os.path.join(base_path, md_file_name)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + md_file_name, suffix='.tmp', dir=base_path or None)
+    try:
+        with open(fd, 'w', encoding='utf-8') as f, zipfile.ZipFile(docx_path) as docx_zip:
+            for block in docx_to_markdown.iter_markdown_blocks(docx_zip, write_image, format_image):
+                f.write(block + '\n\n')
+        os.replace(tmp_path, md_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if docx_images is not None:
+        docx_images.clear()
+        docx_images.update(written_images)
+    return md_path
+
+
+def ingest_docx_files(blog_path, target_jekyll_img_folder, force=False, img_settings=None, manifest=None):
+    """
+    This function will convert the .docx files in the path which have not been converted yet, or which changed since
+    they have been converted as recorded in the manifest
+    :param blog_path: The path contains the .docx files
+    :param target_jekyll_img_folder: The target img folder in Jekyll site
+    :param force: Convert the .docx files again even if their .md file exists and they are unchanged
+    :param img_settings: ImageOptimizeSettings to link to the optimized images, None to link to the images as they are
+    :param manifest: BlogManifest to record each .docx file and the images it wrote in, None to convert only the .docx
+        files without .md file
+    :return: List of the .md file paths written
+    """
+    file_names = os.listdir(blog_path)
+    # Skip the lock files of Word
+    docx_file_names = sorted(item for item in file_names if item.endswith('.docx') and not item.startswith('~$'))
+    md_paths = []
+    for docx_file_name in docx_file_names:
+        docx_path = os.path.join(blog_path, docx_file_name)
+        # Converted again into the same .md file, a second .md file would be another post
+        md_file_name = find_docx_md_file(file_names, docx_file_name)
+        if not force and md_file_name is not None:
+            if manifest is None or manifest.is_docx_unchanged(docx_path):
+                continue
+            if 'sha256' not in manifest.docx_files.get(docx_file_name, {}):
+                # Converted before the .docx files were recorded, the .md file may have been edited since then
+                manifest.record_docx(docx_path)
+                continue
+        try:
+            docx_images = manifest.get_docx_images(docx_file_name) if manifest is not None else None
+            md_paths.append(ingest_docx(docx_path, target_jekyll_img_folder, img_settings, md_file_name, docx_images))
+            if manifest is not None:
+                manifest.record_docx(docx_path)
+            print("Convert .docx file {0} to .md file successfully!".format(docx_file_name))
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+            print("Failed to convert .docx file {0}: {1}".format(docx_file_name, e))
+    if manifest is not None:
+        manifest.prune_docx(docx_file_names)
+        # Keep the records of the converted .docx files even if a later stage fails
+        manifest.save()
+    return md_paths
+
+
+# Jekyll post header template, can be changed with --template
+DEFAULT_HEADER_TEMPLATE_PATH = "D:\\AADProjects\\SharedDocs\\Post_header_template.txt"
+
+
+def list_blog_files(blog_path):
+    """
+    This function will return the .md file names in the path
+    :param blog_path: The path contains the .md files and img folders
+    :return: List of .md file names
+    """
+    blogs = []
+    with os.scandir(blog_path) as it:
+        for entry in it:
+            file_ext = os.path.splitext(entry.name)[1]
+            if "md" in file_ext and not entry.name.startswith('.') and entry.is_file():
+                blogs.append(entry.name)
+    return sorted(blogs)
+
+
+def open_manifest(blog_path, jekyll_img_folder_name, rewrite_rules, img_settings=None):
+    """
+    This function will open the manifest of the path for the given pipeline options
+    :param blog_path: The path contains the .md files and img folders
+    :param jekyll_img_folder_name: The target img folder in Jekyll site
+    :param rewrite_rules: List of rewrite rules, None for the default ones
+    :param img_settings: ImageOptimizeSettings, None when the images are not optimized
+    :return: BlogManifest
+    """
+    # Posts are processed again when the pipeline, the target img folder, the rewrite rules or the image optimization
+    # settings change, the image links depend on the latter
+    rules_hash = hashlib.sha256(json.dumps(rewrite_rules, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    version = '{0}:{1}:{2}'.format(PIPELINE_VERSION, jekyll_img_folder_name, rules_hash)
+    if img_settings is not None:
+        version += ':' + get_img_settings_key(img_settings)
+    return BlogManifest(blog_path, version)
+
+
+def run_blog_automation(blog_path, jekyll_img_folder_name, header_template_path=DEFAULT_HEADER_TEMPLATE_PATH, jobs=1,
+                        force=False, rewrite_rules=None, jekyll_site=None, report_path=None, img_settings=None):
+    """
+    This function will process all posts in the path, and publish the images to the Jekyll site if given
+    :param blog_path: The path contains the .md files and img folders
+    :param jekyll_img_folder_name: The target img folder in Jekyll site
+    :param header_template_path: The path contains the Jekyll post header template
+    :param jobs: Number of worker processes, 0 means the number of CPUs
+    :param force: Process all posts, including the unchanged ones recorded in the manifest
+    :param rewrite_rules: List of rewrite rules, None for the default ones
+    :param jekyll_site: The Jekyll site path, None to not publish the images
+    :param report_path: Write the json/ndjson run report to this path and print the timing summary, None to not
+    :param img_settings: ImageOptimizeSettings to optimize the images and link to them, None to not
+    :return: List of BlogResult which failed or have warnings
+    """
+    run_stages = []
+    results = []
+    try:
+        print("Start doing blog content automation...")
+        print("======================================")
+        print("Start convert .docx files...")
+        with timed_stage(run_stages, 'ingest_docx'):
+            manifest = open_manifest(blog_path, jekyll_img_folder_name, rewrite_rules, img_settings)
+            ingest_docx_files(blog_path, jekyll_img_folder_name, force, img_settings, manifest)
+        print("Start rename blog files...")
+        with timed_stage(run_stages, 'rename_file'):
+            with PostCatalog(blog_path) as catalog:
+                rename_file(blog_path, catalog)
+        if not os.path.exists(os.path.join(blog_path, 'images')):
+            os.makedirs(os.path.join(blog_path, 'images'))
+        print("Start modifying blog header, rename image files, copy images to 'images' folder, remove internal links, "
+              "remove start angle brackets, and modify image links...")
+        blogs = list_blog_files(blog_path)
+        passes = default_passes(header_template_path, jekyll_img_folder_name, rewrite_rules, img_settings)
+        with timed_stage(run_stages, 'manifest'):
+            manifest.prune(blogs)
+            blog_item_paths = [os.path.join(blog_path, blog_item) for blog_item in blogs]
+            if not force:
+                blog_item_paths = [item for item in blog_item_paths if not manifest.is_unchanged(item)]
+                print("Skip {0} unchanged blogs.".format(len(blogs) - len(blog_item_paths)))
+        # The stored image names are only needed by the posts to process
+        if blog_item_paths:
+            with timed_stage(run_stages, 'dedup_images'):
+                index = get_img_folder_index(blog_path)
+                index.add_known_hashes(manifest.get_image_hashes())
+                dedup_map = index.get_dedup_map()
+                print("Found {0} duplicated images.".format(len(dedup_map)))
+        try:
+            with timed_stage(run_stages, 'process_blogs'):
+                failed = print_report(keep_results(record_results(process_blogs(blog_item_paths, passes, jobs),
+                                                                  manifest), results))
+        finally:
+            manifest.save()
+        images_path = os.path.join(blog_path, 'images')
+        if img_settings is not None:
+            print("Start optimizing images...")
+            with timed_stage(run_stages, 'optimize_images'):
+                optimized_count, cached_count = optimize_images(images_path, img_settings, jobs)
+            print("Optimized {0} images, {1} images unchanged.".format(optimized_count, cached_count))
+            images_path = os.path.join(images_path, OPTIMIZED_FOLDER_NAME)
+        if jekyll_site:
+            print("Start publishing images to Jekyll site...")
+            with timed_stage(run_stages, 'publish_images'):
+                published_count, skipped_count = publish_images(images_path, jekyll_site, jekyll_img_folder_name)
+            print("Published {0} images, skipped {1} unchanged images.".format(published_count, skipped_count))
+        print("Start updating post catalog...")
+        with timed_stage(run_stages, 'catalog'):
+            with PostCatalog(blog_path) as catalog:
+                catalog.record_posts((result.file_name, result.catalog_entry) for result in results
+                                     if result.catalog_entry is not None)
+                scanned_count, removed_count = catalog.update()
+        print("Catalog updated, scanned {0} blogs, removed {1} blogs.".format(scanned_count, removed_count))
+        return failed
+    finally:
+        # The report is written also when a stage failed, with the stages and posts done until then
+        if report_path:
+            report = build_run_report(blog_path, results, run_stages)
+            write_run_report(report, report_path)
+            print_timing_summary(report)
+            print("Run report written to {0}".format(report_path))
+
+
+def run_profiled(profile, profile_output, func, *args, **kwargs):
+    """
+    This function will run func under cProfile or tracemalloc, and print the top functions or allocations. Only the
+    current process is profiled, not the worker processes.
+    :param profile: 'cprofile' or 'tracemalloc'
+    :param profile_output: Path to dump the cProfile stats to, readable with pstats
+    :param func: The function to run
+    :return: The result of func
+    """
+    if profile == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            profiler.dump_stats(profile_output)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+            print("Profile written to {0}".format(profile_output))
+    import tracemalloc
+    tracemalloc.start(10)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("Peak traced memory: {0:.1f} KiB".format(peak_memory / 1024.0))
+        for stat in snapshot.statistics('lineno')[:15]:
+            print(stat)
+
+
+class InotifyWatcher(object):
+    """
+    Watch the path and its img folders with Linux inotify, through ctypes.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, blog_path):
+        import ctypes
+        import ctypes.util
+        self.blog_path = blog_path
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> img folder name, '' for the path itself
+        self._watches = {}
+        self._add_watch('')
+        with os.scandir(blog_path) as it:
+            for entry in it:
+                if is_watched_name(entry.name) and entry.is_dir():
+                    self._add_watch(entry.name)
+
+    def _add_watch(self, folder_name):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(os.path.join(self.blog_path, folder_name)),
+                                          self.WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = folder_name
+
+    def wait(self, timeout):
+        """
+        Wait for changes.
+        :param timeout: Max seconds to wait
+        :return: Set of changed .md file names and img folder names, WATCH_RESCAN if the events overflowed
+        """
+        ready = select.select([self._fd], [], [], timeout)[0]
+        if not ready:
+            return set()
+        data = os.read(self._fd, 64 * 1024)
+        changes = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                changes.add(WATCH_RESCAN)
+                continue
+            folder_name = self._watches.get(wd)
+            if mask & self.IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if folder_name is None:
+                continue
+            if folder_name:
+                changes.add(folder_name)
+            elif is_watched_name(name):
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_watch(name)
+                changes.add(name)
+        return changes
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher(object):
+    """
+    Watch the path and its img folders by comparing the stat of the entries, when inotify is not available.
+    """
+
+    def __init__(self, blog_path, poll_interval=1.0):
+        self.blog_path = blog_path
+        self.poll_interval = poll_interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.blog_path) as it:
+            for entry in it:
+                if not is_watched_name(entry.name):
+                    continue
+                try:
+                    if entry.is_dir():
+                        with os.scandir(entry.path) as folder_it:
+                            snapshot[entry.name] = frozenset((item.name, item.stat().st_mtime_ns, item.stat().st_size)
+                                                             for item in folder_it)
+                    else:
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    continue
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.poll_interval))
+        snapshot = self._scan()
+        changes = set(name for name in set(snapshot) | set(self._snapshot)
+                      if snapshot.get(name) != self._snapshot.get(name))
+        self._snapshot = snapshot
+        return changes
+
+    def close(self):
+        pass
+
+
+# Returned by the watchers when the changes are unknown and all posts should be checked
+WATCH_RESCAN = '*'
+
+
+def is_watched_name(name):
+    """
+    :param name: Name of an entry in the path
+    :return: True if changes of the entry should trigger processing, i.e. .md files and img folders
+    """
+    return not name.startswith(('.', '~$')) and name != 'images' and not name.endswith('.tmp')
+
+
+def process_changes(blog_path, changes, passes, manifest, jekyll_img_folder_name, jekyll_site=None,
+                    img_settings=None):
+    """
+    This function will process the posts affected by the changes in the path, i.e. the changed .md files and the
+    posts whose img folder changed. Posts unchanged since they have been processed are skipped, which includes the
+    changes made by the script itself.
+    :param blog_path: The path contains the .md files and img folders
+    :param changes: Set of changed .md file names and img folder names
+    :param passes: Ordered list of transform passes, each pass accepts a BlogDocument
+    :param manifest: BlogManifest
+    :param jekyll_img_folder_name: The target img folder in Jekyll site
+    :param jekyll_site: The Jekyll site path, None to not publish the images
+    :param img_settings: ImageOptimizeSettings to optimize the images and link to them, None to not
+    :return: List of BlogResult which failed or have warnings
+    """
+    index = get_img_folder_index(blog_path)
+    if WATCH_RESCAN in changes:
+        index = get_img_folder_index(blog_path, refresh=True)
+    changed_folders = set()
+    changed_blogs = set()
+    for name in changes:
+        if name in index.folders or os.path.isdir(os.path.join(blog_path, name)):
+            index.rescan_folder(name)
+            changed_folders.add(name)
+        elif name.endswith('.docx'):
+            docx_path = os.path.join(blog_path, name)
+            if os.path.exists(docx_path) and not manifest.is_docx_unchanged(docx_path):
+                md_path = ingest_docx(docx_path, jekyll_img_folder_name, img_settings,
+                                      find_docx_md_file(os.listdir(blog_path), name), manifest.get_docx_images(name))
+                manifest.record_docx(docx_path)
+                print("Convert .docx file {0} to .md file successfully!".format(name))
+                changed_blogs.add(os.path.basename(md_path))
+                # The stored names of the img folder images depend on the images in 'images' folder
+                index.reset_stored_names()
+        else:
+            changed_blogs.add(name)
+    # New posts converted by pandoc have spaces in the file name
+    if WATCH_RESCAN in changes or any(" " in name for name in changed_blogs):
+        renamed_files = rename_file(blog_path)
+        changed_blogs = set(renamed_files.get(name, name) for name in changed_blogs)
+    blogs = list_blog_files(blog_path)
+    blog_item_paths = [os.path.join(blog_path, blog_item) for blog_item in blogs
+                       if WATCH_RESCAN in changes or blog_item in changed_blogs
+                       or index.find_folder(get_post_title(blog_item)) in changed_folders]
+    blog_item_paths = [item for item in blog_item_paths if not manifest.is_unchanged(item)]
+    if not blog_item_paths:
+        return []
+    index.add_known_hashes(manifest.get_image_hashes())
+    try:
+        failed = print_report(record_results(process_blogs(blog_item_paths, passes), manifest))
+    finally:
+        manifest.save()
+    images_path = os.path.join(blog_path, 'images')
+    if img_settings is not None:
+        optimized_count, cached_count = optimize_images(images_path, img_settings, jobs=0)
+        print("Optimized {0} images, {1} images unchanged.".format(optimized_count, cached_count))
+        images_path = os.path.join(images_path, OPTIMIZED_FOLDER_NAME)
+    if jekyll_site:
+        published_count, skipped_count = publish_images(images_path, jekyll_site, jekyll_img_folder_name)
+        print("Published {0} images, skipped {1} unchanged images.".format(published_count, skipped_count))
+    return failed
+
+
+def watch_blog_path(blog_path, jekyll_img_folder_name, header_template_path=DEFAULT_HEADER_TEMPLATE_PATH,
+                    rewrite_rules=None, jekyll_site=None, debounce=2.0, poll_interval=1.0, use_inotify=True,
+                    img_settings=None):
+    """
+    This function will keep watching the path, and process the new or changed posts once no more changes happen for
+    debounce seconds. The header template, the img folder index and the manifest are kept in memory.
+    :param blog_path: The path contains the .md files and img folders
+    :param jekyll_img_folder_name: The target img folder in Jekyll site
+    :param header_template_path: The path contains the Jekyll post header template
+    :param rewrite_rules: List of rewrite rules, None for the default ones
+    :param jekyll_site: The Jekyll site path, None to not publish the images
+    :param debounce: Seconds without changes before processing
+    :param poll_interval: Seconds between two scans when inotify is not available
+    :param use_inotify: Use inotify when available
+    :param img_settings: ImageOptimizeSettings to optimize the images and link to them, None to not
+    :return:
+    """
+    if not os.path.exists(os.path.join(blog_path, 'images')):
+        os.makedirs(os.path.join(blog_path, 'images'))
+    passes = default_passes(header_template_path, jekyll_img_folder_name, rewrite_rules, img_settings)
+    manifest = open_manifest(blog_path, jekyll_img_folder_name, rewrite_rules, img_settings)
+    watcher = None
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(blog_path)
+        except (OSError, AttributeError) as e:
+            print("inotify is not available, fall back to polling: {0}".format(e))
+    if watcher is None:
+        watcher = PollingWatcher(blog_path, poll_interval)
+    # Process the posts which changed while not watching
+    print("Start watching {0}...".format(blog_path))
+    pending_changes = {WATCH_RESCAN}
+    last_change_time = 0
+    try:
+        while True:
+            changes = watcher.wait(debounce if pending_changes else 3600)
+            now = time.monotonic()
+            if changes:
+                pending_changes |= changes
+                last_change_time = now
+            elif pending_changes and now - last_change_time >= debounce:
+                try:
+                    process_changes(blog_path, pending_changes, passes, manifest, jekyll_img_folder_name,
+                                    jekyll_site, img_settings)
+                except Exception as e:
+                    print("Failed to process changes {0}\n{1}: {2}".format(', '.join(sorted(pending_changes)),
+                                                                          type(e).__name__, e))
+                pending_changes = set()
+    except KeyboardInterrupt:
+        print("Stop watching {0}.".format(blog_path))
+    finally:
+        watcher.close()
+
+
+def print_catalog(blog_path, listing):
+    """
+    This function will update the post catalog of the path, and print one of its listings
+    :param blog_path: The path contains the .md files and img folders
+    :param listing: 'date', 'missing-images' or 'safelinks'
+    :return:
+    """
+    with PostCatalog(blog_path) as catalog:
+        scanned_count, removed_count = catalog.update()
+        print("Catalog updated, scanned {0} blogs, removed {1} blogs.".format(scanned_count, removed_count))
+        print("======================================")
+        if listing == 'date':
+            rows = catalog.list_posts_by_date()
+            for row in rows:
+                print("{0}  {1}".format(row['date'] or '----------', row['file_name']))
+            print("{0} blogs.".format(len(rows)))
+        elif listing == 'missing-images':
+            rows = catalog.list_missing_images()
+            for row in rows:
+                print("{0}  image {1}: {2}".format(row['file_name'], row['position'], row['link']))
+            print("{0} missing images.".format(len(rows)))
+        else:
+            rows = catalog.list_posts_with_safelinks()
+            for row in rows:
+                print("{0}  {1} internal links".format(row['file_name'], row['safelink_count']))
+            print("{0} blogs with internal links.".format(len(rows)))
+
+
+def parse_widths(value):
+    """
+    :param value: Comma separated widths, like '480,960'
+    :return: Tuple of the widths
+    """
+    try:
+        widths = tuple(int(width) for width in value.split(',') if width.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid widths: {0}".format(value))
+    if any(width <= 0 for width in widths):
+        raise argparse.ArgumentTypeError("invalid widths: {0}".format(value))
+    return widths
+
+
+def add_common_arguments(parser, suppress_defaults=False):
+    """
+    This function will add the options of the run and watch commands to the parser
+    :param parser: argparse.ArgumentParser
+    :param suppress_defaults: Don't set the defaults, for the copies of the options in the commands, so that they
+        don't overwrite the options given before the command
+    :return:
+    """
+    default = (lambda value: argparse.SUPPRESS) if suppress_defaults else (lambda value: value)
+    parser.add_argument('--template', default=default(DEFAULT_HEADER_TEMPLATE_PATH),
+                        help="Path of the Jekyll post header template (default: {0})"
+                        .format(DEFAULT_HEADER_TEMPLATE_PATH.replace('%', '%%')))
+    parser.add_argument('--rules', default=default(None),
+                        help="Path of a json file with the rewrite rules, replacing the default ones")
+    parser.add_argument('--jekyll-site', default=default(None),
+                        help="Path of the Jekyll site, the images are synced to its /assets/images/<img folder>")
+    parser.add_argument('--optimize-images', action='store_true', default=default(False),
+                        help="Resize and recompress the images without metadata, and link to them, needs Pillow")
+    parser.add_argument('--max-width', type=int, default=default(1600),
+                        help="Optimized images wider are resized, 0 to keep the size (default: 1600)")
+    parser.add_argument('--quality', type=int, default=default(82),
+                        help="Quality of the optimized JPEG and WebP images (default: 82)")
+    parser.add_argument('--webp', action='store_true', default=default(False),
+                        help="Convert the optimized images to WebP")
+    parser.add_argument('--responsive-widths', type=parse_widths, default=default(()),
+                        help="Comma separated widths of the responsive variants of the optimized images, e.g. 480,960")
+
+
+def add_run_arguments(parser, suppress_defaults=False):
+    """
+    This function will add the options of the run command to the parser
+    :param parser: argparse.ArgumentParser
+    :param suppress_defaults: Don't set the defaults, see add_common_arguments
+    :return:
+    """
+    default = (lambda value: argparse.SUPPRESS) if suppress_defaults else (lambda value: value)
+    parser.add_argument('--jobs', type=int, default=default(1),
+                        help="Number of posts processed in parallel, 0 means the number of CPUs (default: 1)")
+    parser.add_argument('--force', action='store_true', default=default(False),
+                        help="Process all posts, including the unchanged ones recorded in the manifest")
+    parser.add_argument('--report', default=default(None),
+                        help="Write the run report with the per post and per stage timings to this json file, "
+                             "ndjson if it ends with .ndjson or .jsonl, and print the timing summary")
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=default(None),
+                        help="Profile the run, use with --jobs 1 as the worker processes are not profiled")
+    parser.add_argument('--profile-output', default=default('automate_blog_content.prof'),
+                        help="Path of the cProfile stats (default: automate_blog_content.prof)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Automate the blog content for Jekyll site. Without command, the "
+                                                 "paths are prompted. The options can be given before or after the "
+                                                 "command.")
+    add_common_arguments(parser)
+    add_run_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    parser_run = subparsers.add_parser('run', help="Process all posts once")
+    add_common_arguments(parser_run, suppress_defaults=True)
+    add_run_arguments(parser_run, suppress_defaults=True)
+    parser_watch = subparsers.add_parser('watch', help="Keep processing the new or changed posts")
+    add_common_arguments(parser_watch, suppress_defaults=True)
+    for command_parser in (parser_run, parser_watch):
+        command_parser.add_argument('blog_path', help="The path contains the .md files and img folders")
+        command_parser.add_argument('jekyll_img_folder', help="The target Jekyll site image folder name")
+    parser_watch.add_argument('--debounce', type=float, default=2.0,
+                              help="Seconds without changes before processing (default: %(default)s)")
+    parser_watch.add_argument('--poll-interval', type=float, default=1.0,
+                              help="Seconds between two scans when inotify is not used (default: %(default)s)")
+    parser_watch.add_argument('--no-inotify', action='store_true', help="Always use polling")
+    parser_catalog = subparsers.add_parser('catalog', help="Update the post catalog and print a listing")
+    parser_catalog.add_argument('blog_path', help="The path contains the .md files and img folders")
+    parser_catalog.add_argument('--list', choices=['date', 'missing-images', 'safelinks'], default='date',
+                                help="The listing to print (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'catalog':
+        if not os.path.isdir(args.blog_path):
+            parser.error("The path {0} does not exists.".format(args.blog_path))
+        print_catalog(args.blog_path, args.list)
+        return 0
+
+    if args.command is None:
+        # Ask for a path contains the .md files and image folders, also prompt to enter a target Jekyll image folder.
+        while True:
+            blog_path = input("Please enter the path contains the .md files and img folders:")
+            jekyll_img_folder_name = input("Please enter the target jekyll site image folder name:")
+            if not os.path.exists(blog_path):
+                print("The path does not exists, please enter a valid path.")
+                os.system('cls')
+            else:
+                break
+    else:
+        blog_path = args.blog_path
+        jekyll_img_folder_name = args.jekyll_img_folder
+        if not os.path.isdir(blog_path):
+            parser.error("The path {0} does not exists.".format(blog_path))
+    img_settings = None
+    if args.optimize_images:
+        if Image is None:
+            parser.error("Pillow is needed to optimize the images, install it with 'pip install pillow'.")
+        img_settings = ImageOptimizeSettings(args.max_width or None, args.quality, args.webp, args.responsive_widths)
+    try:
+        rewrite_rules = load_rewrite_rules(args.rules) if args.rules else None
+        if args.command == 'watch':
+            watch_blog_path(blog_path, jekyll_img_folder_name, args.template, rewrite_rules, args.jekyll_site,
+                            args.debounce, args.poll_interval, not args.no_inotify, img_settings)
+            return 0
+        run_args = (blog_path, jekyll_img_folder_name, args.template, args.jobs, args.force, rewrite_rules,
+                    args.jekyll_site, args.report, img_settings)
+        if args.profile:
+            failed = run_profiled(args.profile, args.profile_output, run_blog_automation, *run_args)
+        else:
+            failed = run_blog_automation(*run_args)
+        if not failed:
+            print("Successfully completed all work!")
+            return 0
+        print("{0} blogs failed or have warnings, see above.".format(len(failed)))
+    except RunStageError as e:
+        print(e)
+    except Exception as e:
+        print("Failed: {0}: {1}".format(type(e).__name__, e))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""
+Benchmarks of the blog content automation.
+
+Generate a synthetic corpus of pandoc converted posts and time every stage of automate_blog_content on it:
+    python -m benchmarks --posts 10 1000 100000
+"""
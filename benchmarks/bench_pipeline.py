@@ -0,0 +1,216 @@
+"""
+Time every stage of automate_blog_content, and the whole run, on synthetic corpora of increasing size.
+
+For each stage the corpus is copied to a work folder and prepared (untimed), then the stage runs over all posts.
+Recorded per stage: wall time, file opens and filesystem calls (counted with audit hooks, os.stat is not audited),
+and peak Python memory (tracemalloc, which slows the run down, disable it with --no-tracemalloc to compare times).
+With --jobs > 1 the end to end run happens in worker processes, whose file opens and memory are not counted.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+import automate_blog_content as blog
+from benchmarks.corpus import generate_corpus, write_header_template
+
+TARGET_JEKYLL_IMG_FOLDER = 'bench'
+# Audit events of the filesystem operations made by the stages
+FS_AUDIT_EVENTS = {'open', 'os.listdir', 'os.scandir', 'os.rename', 'os.remove', 'os.link', 'os.mkdir', 'os.utime',
+                   'os.chmod', 'shutil.copyfile', 'shutil.copymode'}
+
+_audit_counts = None
+
+
+def _audit_hook(event, args):
+    if _audit_counts is not None and event in FS_AUDIT_EVENTS:
+        _audit_counts[event] = _audit_counts.get(event, 0) + 1
+
+
+sys.addaudithook(_audit_hook)
+
+
+def list_blog_paths(work_path):
+    return [os.path.join(work_path, blog_item) for blog_item in blog.list_blog_files(work_path)]
+
+
+def prepare_renamed(work_path, template_path):
+    blog.rename_file(work_path)
+    os.makedirs(os.path.join(work_path, 'images'), exist_ok=True)
+
+
+def run_rename_file(work_path, template_path):
+    blog.rename_file(work_path)
+
+
+def run_modify_blog_header(work_path, template_path):
+    for blog_path in list_blog_paths(work_path):
+        blog.modify_blog_header(template_path, blog_path)
+
+
+def run_remove_internal_links(work_path, template_path):
+    for blog_path in list_blog_paths(work_path):
+        blog.remove_internal_links(blog_path)
+
+
+def run_remove_start_brackets(work_path, template_path):
+    for blog_path in list_blog_paths(work_path):
+        blog.remove_start_brackets(blog_path)
+
+
+def run_modify_image_link(work_path, template_path):
+    for blog_path in list_blog_paths(work_path):
+        blog.modify_image_link(blog_path, TARGET_JEKYLL_IMG_FOLDER)
+
+
+def run_rename_img_file(work_path, template_path):
+    for blog_path in list_blog_paths(work_path):
+        blog.rename_img_file(blog_path)
+
+
+def make_run_end_to_end(jobs):
+    def run_end_to_end(work_path, template_path):
+        blog.run_blog_automation(work_path, TARGET_JEKYLL_IMG_FOLDER, template_path, jobs=jobs, force=True)
+    return run_end_to_end
+
+
+# Stage name -> (prepare function, run function), run functions accept (work path, header template path)
+STAGES = {
+    'rename_file': (None, run_rename_file),
+    'modify_blog_header': (prepare_renamed, run_modify_blog_header),
+    'remove_internal_links': (prepare_renamed, run_remove_internal_links),
+    'remove_start_brackets': (prepare_renamed, run_remove_start_brackets),
+    'modify_image_link': (prepare_renamed, run_modify_image_link),
+    'rename_img_file': (prepare_renamed, run_rename_img_file),
+    'end_to_end': (None, None),
+}
+
+
+def reset_caches():
+    """
+    Drop the caches of automate_blog_content, so that every stage starts cold.
+    """
+    blog._img_folder_indexes.clear()
+    blog._header_templates.clear()
+
+
+def measure(func, trace_memory=True):
+    """
+    This function will run func and measure it
+    :param func: Function without parameters
+    :param trace_memory: Record the peak memory with tracemalloc
+    :return: dict with wall_time, file_opens, fs_calls and peak_memory (None if not traced)
+    """
+    global _audit_counts
+    peak_memory = None
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        if trace_memory:
+            tracemalloc.start()
+        _audit_counts = {}
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            wall_time = time.perf_counter() - start
+            counts = _audit_counts
+            _audit_counts = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    return {'wall_time': wall_time, 'file_opens': counts.get('open', 0), 'fs_calls': sum(counts.values()),
+            'peak_memory': peak_memory}
+
+
+def bench_stage(stage, corpus_path, template_path, work_root, jobs=1, trace_memory=True):
+    """
+    This function will copy the corpus, prepare it for the stage and measure the stage over all posts
+    :param stage: Stage name in STAGES
+    :param corpus_path: The generated corpus path
+    :param template_path: The header template path
+    :param work_root: The folder to copy the corpus to
+    :param jobs: Number of worker processes of the end to end run
+    :param trace_memory: Record the peak memory with tracemalloc
+    :return: dict of the measures
+    """
+    prepare, run = STAGES[stage]
+    if stage == 'end_to_end':
+        run = make_run_end_to_end(jobs)
+    work_path = os.path.join(work_root, stage)
+    shutil.rmtree(work_path, ignore_errors=True)
+    shutil.copytree(corpus_path, work_path)
+    reset_caches()
+    if prepare is not None:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            prepare(work_path, template_path)
+    try:
+        return measure(lambda: run(work_path, template_path), trace_memory)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def format_size(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return '{0:.0f}{1}'.format(size, unit)
+        size /= 1024.0
+    return '{0:.1f}GiB'.format(size)
+
+
+def print_results(results):
+    print('{0:>7} {1:<22} {2:>10} {3:>11} {4:>10} {5:>10} {6:>10}'.format(
+        'posts', 'stage', 'wall (s)', 'posts/s', 'opens', 'fs calls', 'peak mem'))
+    for result in results:
+        posts_per_second = result['posts'] / result['wall_time'] if result['wall_time'] else float('inf')
+        print('{0:>7} {1:<22} {2:>10.3f} {3:>11.0f} {4:>10} {5:>10} {6:>10}'.format(
+            result['posts'], result['stage'], result['wall_time'], posts_per_second, result['file_opens'],
+            result['fs_calls'], format_size(result['peak_memory'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark automate_blog_content on synthetic corpora.")
+    parser.add_argument('--posts', type=int, nargs='+', default=[10, 100, 1000],
+                        help="Corpus sizes in number of posts (default: %(default)s)")
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), default=list(STAGES),
+                        help="Stages to measure (default: all)")
+    parser.add_argument('--jobs', type=int, default=1, help="Worker processes of the end to end run (default: 1)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the corpus (default: 0)")
+    parser.add_argument('--max-images', type=int, default=6, help="Max images per post (default: %(default)s)")
+    parser.add_argument('--img-size', type=int, default=16 * 1024,
+                        help="Average image size in bytes (default: %(default)s)")
+    parser.add_argument('--work-dir', default=None, help="Folder for the corpora, a temp folder by default")
+    parser.add_argument('--no-tracemalloc', action='store_true', help="Don't record the peak memory")
+    parser.add_argument('--output', default=None, help="Write the results to this json file")
+    args = parser.parse_args(argv)
+
+    work_root = tempfile.mkdtemp(prefix='blog_bench_', dir=args.work_dir)
+    results = []
+    try:
+        template_path = write_header_template(os.path.join(work_root, 'Post_header_template.txt'))
+        for post_count in args.posts:
+            corpus_path = os.path.join(work_root, 'corpus_{0}'.format(post_count))
+            print("Generating corpus of {0} posts...".format(post_count))
+            generate_corpus(corpus_path, post_count, seed=args.seed, max_img_count=args.max_images,
+                            img_size=args.img_size)
+            for stage in args.stages:
+                result = bench_stage(stage, corpus_path, template_path, work_root, args.jobs,
+                                     not args.no_tracemalloc)
+                result.update({'posts': post_count, 'stage': stage, 'jobs': args.jobs if stage == 'end_to_end' else 1})
+                results.append(result)
+                print_results([result])
+            shutil.rmtree(corpus_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+    print()
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    return 0
@@ -0,0 +1,113 @@
+"""
+Synthetic corpus of posts as they look after pandoc conversion and html image export, i.e. the input of
+automate_blog_content: a 'Post Title.md' file per post, with the title on line 1, the date on line 3, an optional
+author line containing non-breaking spaces, paragraphs with internal safelinks, lines starting with '>' and image
+references, and an img folder 'Post-Title_files' with the exported images.
+"""
+
+import os
+import random
+from datetime import date, timedelta
+
+WORDS = ['azure', 'active', 'directory', 'conditional', 'access', 'policy', 'identity', 'tenant', 'sync', 'connect',
+         'password', 'reset', 'guest', 'users', 'token', 'lifetime', 'application', 'proxy', 'federation', 'claims',
+         'group', 'license', 'sign', 'audit', 'logs', 'graph', 'device', 'registration', 'hybrid', 'join', 'mfa',
+         'session', 'consent', 'permission', 'role', 'privileged', 'review', 'b2b', 'b2c', 'certificate']
+
+HEADER_TEMPLATE = ('---\n'
+                   'layout: post\n'
+                   'title: "Post title"\n'
+                   'author: AAD team\n'
+                   'categories: [aad]\n'
+                   'tags: [aad]\n'
+                   'comments: true\n'
+                   '---\n'
+                   '\n')
+
+SAFELINK = ('https://nam06.safelinks.protection.outlook.com/?url=https%3A%2F%2Fdocs.microsoft.com%2F{0}'
+            '&data=04%7C01%7C%7Cabc%7C72f988bf86f141af91ab2d7cd011db47&sdata=xyz%3D&reserved=0')
+
+
+def write_header_template(template_path):
+    """
+    This function will write a Jekyll post header template
+    :param template_path: The template file path
+    :return: template_path
+    """
+    with open(template_path, 'w', encoding='utf-8') as f:
+        f.write(HEADER_TEMPLATE)
+    return template_path
+
+
+def generate_post(rng, title, post_date, img_count, author_ratio, safelink_ratio, quote_ratio, paragraph_count):
+    """
+    This function will return the content of a converted post
+    :return: .md file content
+    """
+    lines = ['# {0}\n'.format(title), '\n',
+             '{0:%A}, {0:%B} {1}, {2}\n'.format(post_date, post_date.day, post_date.year), '\n',
+             '{0}:{1:02d} AM\n'.format(rng.randint(1, 11), rng.randint(0, 59)), '\n']
+    if rng.random() < author_ratio:
+        lines += ['Author:\xa0{0}\xa0{1}\n'.format(rng.choice(WORDS).title(), rng.choice(WORDS).title()), '\n']
+    # Spread the image references over the paragraphs, in order
+    img_positions = sorted(rng.randrange(paragraph_count) for _ in range(img_count))
+    img_number = 1
+    for i in range(paragraph_count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(20, 80))]
+        if rng.random() < safelink_ratio:
+            position = rng.randrange(len(words))
+            words[position] = '[{0}]({1})'.format(words[position], SAFELINK.format(rng.choice(WORDS)))
+        paragraph = ' '.join(words) + '\n'
+        if rng.random() < quote_ratio:
+            paragraph = '>' + paragraph
+        lines += [paragraph, '\n']
+        while img_positions and img_positions[0] == i:
+            img_positions.pop(0)
+            lines += ['![](media/image{0}.png){{width="6.5in" height="3.2in"}}\n'.format(img_number), '\n']
+            img_number += 1
+    return ''.join(lines)
+
+
+def generate_corpus(corpus_path, post_count, seed=0, max_img_count=6, img_size=16 * 1024, duplicate_img_ratio=0.2,
+                    author_ratio=0.5, safelink_ratio=0.3, quote_ratio=0.1, paragraph_count=20):
+    """
+    This function will generate a synthetic corpus of converted posts and their img folders
+    :param corpus_path: The path to generate the corpus in, created if it does not exist
+    :param post_count: Number of posts
+    :param seed: Random seed, the same seed generates the same corpus
+    :param max_img_count: Max number of images per post
+    :param img_size: Average size in bytes of an image
+    :param duplicate_img_ratio: Ratio of the images which are a copy of a previous image (e.g. a logo)
+    :param author_ratio: Ratio of the posts with an author line
+    :param safelink_ratio: Ratio of the paragraphs with an internal link
+    :param quote_ratio: Ratio of the paragraphs starting with '>'
+    :param paragraph_count: Number of paragraphs per post
+    :return: List of the generated .md file paths
+    """
+    rng = random.Random(seed)
+    os.makedirs(corpus_path, exist_ok=True)
+    first_date = date(2018, 1, 1)
+    shared_imgs = []
+    blog_paths = []
+    for n in range(post_count):
+        title = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(2, 6))) + ' {0}'.format(n)
+        post_date = first_date + timedelta(days=rng.randrange(1500))
+        img_count = rng.randint(0, max_img_count)
+        blog_path = os.path.join(corpus_path, title + '.md')
+        with open(blog_path, 'w', encoding='utf-8') as f:
+            f.write(generate_post(rng, title, post_date, img_count, author_ratio, safelink_ratio, quote_ratio,
+                                  paragraph_count))
+        blog_paths.append(blog_path)
+        img_folder_path = os.path.join(corpus_path, title.replace(' ', '-') + '_files')
+        os.makedirs(img_folder_path, exist_ok=True)
+        for i in range(img_count):
+            if shared_imgs and rng.random() < duplicate_img_ratio:
+                img_data = rng.choice(shared_imgs)
+            else:
+                data_size = rng.randint(img_size // 2, img_size * 3 // 2)
+                img_data = rng.getrandbits(8 * data_size).to_bytes(data_size, 'little')
+                if len(shared_imgs) < 32:
+                    shared_imgs.append(img_data)
+            with open(os.path.join(img_folder_path, 'image{0:03d}.png'.format(i + 1)), 'wb') as f:
+                f.write(img_data)
+    return blog_paths
@@ -0,0 +1,233 @@
+"""
+Convert the body of a .docx file to markdown, in a single streaming pass over word/document.xml read straight from
+the zip archive, without extracting the file and without pandoc.
+
+Paragraphs, headings, bold and italic runs, hyperlinks, bullet lists, quotes and tables are converted. Images are handed
+to a callback in document order, so the caller can stream them from word/media to their final location and return the
+link to put in the markdown.
+"""
+
+import posixpath
+from xml.etree import ElementTree
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+V = '{urn:schemas-microsoft-com:vml}'
+MC = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+PACKAGE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+DOCUMENT_PATH = 'word/document.xml'
+RELATIONSHIPS_PATH = 'word/_rels/document.xml.rels'
+QUOTE_STYLES = ('Quote', 'IntenseQuote')
+
+
+def read_relationships(docx_zip):
+    """
+    This function will return the relationships of the document, i.e. the targets of the images and hyperlinks
+    :param docx_zip: The .docx file opened as zipfile.ZipFile
+    :return: dict relationship id -> zip member name of the image, or url of the external hyperlink
+    """
+    relationships = {}
+    try:
+        f = docx_zip.open(RELATIONSHIPS_PATH)
+    except KeyError:
+        return relationships
+    with f:
+        for relationship in ElementTree.parse(f).getroot().iter(PACKAGE_RELATIONSHIPS + 'Relationship'):
+            target = relationship.get('Target', '')
+            if relationship.get('TargetMode') != 'External':
+                # Internal targets are relative to the word folder, e.g. media/image1.png
+                target = target.lstrip('/') if target.startswith('/') else posixpath.normpath(
+                    posixpath.join('word', target))
+            relationships[relationship.get('Id')] = target
+    return relationships
+
+
+def is_on(element):
+    """
+    :param element: A run property element like w:b, or None
+    :return: True if the property is set
+    """
+    return element is not None and element.get(W + 'val', 'true') not in ('0', 'false', 'none')
+
+
+class _Paragraph(object):
+
+    def __init__(self):
+        self.parts = []
+        # part index -> image markdown
+        self.images = {}
+        self.style = None
+        self.list_level = None
+        self.link_start = None
+        self.link_target = None
+
+    def add_text(self, text):
+        if text:
+            self.parts.append(text)
+
+    def blocks(self):
+        """
+        Split the paragraph into markdown blocks, images are put on their own line.
+        :return: List of markdown blocks
+        """
+        blocks = []
+        text_parts = []
+        for i, part in enumerate(self.parts):
+            if i in self.images:
+                blocks.append(self._format(''.join(text_parts)))
+                blocks.append(self.images[i])
+                text_parts = []
+            else:
+                text_parts.append(part)
+        blocks.append(self._format(''.join(text_parts)))
+        return [block for block in blocks if block]
+
+    def _format(self, text):
+        text = text.strip()
+        if not text:
+            return ''
+        if self.style and self.style.lower().startswith('heading') and self.style[-1:].isdigit():
+            return '#' * min(int(self.style[-1]), 6) + ' ' + text
+        if self.list_level is not None:
+            return '  ' * self.list_level + '- ' + text
+        if self.style in QUOTE_STYLES:
+            return '> ' + text
+        return text
+
+
+def format_run(text, bold, italic):
+    """
+    :return: The run text with markdown emphasis, the surrounding spaces are kept outside the markers
+    """
+    if not text.strip() or not (bold or italic):
+        return text
+    marker = '**' if bold and not italic else '*' if italic and not bold else '***'
+    stripped = text.strip()
+    start = text.index(stripped)
+    return text[:start] + marker + stripped + marker + text[start + len(stripped):]
+
+
+def iter_run_content(element):
+    """
+    This function will iterate the descendants of a run, skipping the fallback content of mc:AlternateContent which
+    duplicates the preferred content (e.g. a VML copy of a drawing)
+    :param element: The w:r element
+    :return: Generator of elements
+    """
+    for child in element:
+        if child.tag == MC + 'Fallback':
+            continue
+        yield child
+        for descendant in iter_run_content(child):
+            yield descendant
+
+
+def format_image(position, link):
+    """
+    :return: The markdown image, like ![0](link)
+    """
+    return '![{0}]({1})'.format(position, link)
+
+
+def iter_markdown_blocks(docx_zip, write_image, format_image=format_image):
+    """
+    This function will convert the document body to markdown blocks, the blocks are separated by a blank line in the
+    markdown file. The document is parsed as a stream and every paragraph is released once converted, so the memory
+    does not grow with the document size.
+    :param docx_zip: The .docx file opened as zipfile.ZipFile
+    :param write_image: Callable accepting (docx_zip, image member name, image position in the document), it writes
+        the image and returns its link. Called once per image, in document order.
+    :param format_image: Callable accepting (image occurrence position, image link), returns the markdown image
+    :return: Generator of markdown blocks
+    """
+    relationships = read_relationships(docx_zip)
+    image_links = {}
+    image_count = 0
+    # Stack of paragraphs, paragraphs can be nested in text boxes
+    paragraphs = []
+    # Stack of tables, each one a list of rows, each row a list of cells, each cell a list of texts
+    tables = []
+    with docx_zip.open(DOCUMENT_PATH) as f:
+        for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+            tag = element.tag
+            paragraph = paragraphs[-1] if paragraphs else None
+            if event == 'start':
+                if tag == W + 'p':
+                    paragraphs.append(_Paragraph())
+                elif tag == W + 'hyperlink' and paragraph is not None:
+                    paragraph.link_start = len(paragraph.parts)
+                    relationship_id = element.get(R + 'id')
+                    anchor = element.get(W + 'anchor')
+                    paragraph.link_target = relationships.get(relationship_id) if relationship_id else (
+                        '#' + anchor if anchor else None)
+                elif tag == W + 'tbl':
+                    tables.append([])
+                elif tag == W + 'tr' and tables:
+                    tables[-1].append([])
+                elif tag == W + 'tc' and tables and tables[-1]:
+                    tables[-1][-1].append([])
+                continue
+
+            if tag == W + 'pStyle' and paragraph is not None:
+                paragraph.style = element.get(W + 'val')
+            elif tag == W + 'numPr' and paragraph is not None:
+                level = element.find(W + 'ilvl')
+                paragraph.list_level = int(level.get(W + 'val', '0')) if level is not None else 0
+            elif tag == W + 'r' and paragraph is not None:
+                properties = element.find(W + 'rPr')
+                bold = properties is not None and is_on(properties.find(W + 'b'))
+                italic = properties is not None and is_on(properties.find(W + 'i'))
+                text_parts = []
+                for child in iter_run_content(element):
+                    if child.tag == W + 't':
+                        text_parts.append(child.text or '')
+                    elif child.tag == W + 'tab':
+                        text_parts.append('\t')
+                    elif child.tag in (W + 'br', W + 'cr'):
+                        text_parts.append('\n')
+                    elif child.tag in (A + 'blip', V + 'imagedata'):
+                        relationship_id = child.get(R + 'embed') or child.get(R + 'id')
+                        member_name = relationships.get(relationship_id)
+                        if member_name is None:
+                            continue
+                        paragraph.add_text(format_run(''.join(text_parts), bold, italic))
+                        text_parts = []
+                        if member_name not in image_links:
+                            image_links[member_name] = write_image(docx_zip, member_name, len(image_links))
+                        paragraph.images[len(paragraph.parts)] = format_image(image_count, image_links[member_name])
+                        paragraph.parts.append('')
+                        image_count += 1
+                paragraph.add_text(format_run(''.join(text_parts), bold, italic))
+                element.clear()
+            elif tag == W + 'hyperlink' and paragraph is not None and paragraph.link_start is not None:
+                link_text = ''.join(paragraph.parts[paragraph.link_start:])
+                if paragraph.link_target and link_text.strip() and not any(
+                        i >= paragraph.link_start for i in paragraph.images):
+                    del paragraph.parts[paragraph.link_start:]
+                    paragraph.parts.append('[{0}]({1})'.format(link_text, paragraph.link_target))
+                paragraph.link_start = None
+            elif tag == W + 'p' and paragraph is not None:
+                paragraphs.pop()
+                blocks = paragraph.blocks()
+                if tables and tables[-1] and tables[-1][-1]:
+                    tables[-1][-1][-1].extend(block.replace('\n', ' ') for block in blocks)
+                else:
+                    for block in blocks:
+                        yield block
+                element.clear()
+            elif tag == W + 'tbl' and tables:
+                rows = tables.pop()
+                lines = []
+                for i, row in enumerate(rows):
+                    cells = [' '.join(cell).replace('|', '\\|') for cell in row]
+                    lines.append('| ' + ' | '.join(cells) + ' |')
+                    if i == 0:
+                        lines.append('|' + '---|' * len(cells))
+                if tables and tables[-1] and tables[-1][-1]:
+                    # Nested table, flatten it into the cell of the outer table
+                    tables[-1][-1][-1].append(' '.join(lines))
+                elif lines:
+                    yield '\n'.join(lines)
+                element.clear()
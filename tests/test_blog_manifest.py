@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from automate_blog_content import BlogManifest, build_post_record, get_img_folder_index
+
+
+class BlogManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+        self.post_path = os.path.join(self.blog_path, '2021-01-02-My-Post.md')
+        self.img_path = os.path.join(self.blog_path, 'My Post_files', 'image001.png')
+        os.makedirs(os.path.dirname(self.img_path))
+        self.write_file(self.post_path, b'# My Post\n')
+        self.write_file(self.img_path, b'png')
+
+    @staticmethod
+    def write_file(file_path, content):
+        with open(file_path, 'wb') as f:
+            f.write(content)
+
+    def record_post(self, version='1'):
+        """
+        :return: The manifest with the post recorded, saved and opened again
+        """
+        get_img_folder_index(self.blog_path, refresh=True)
+        manifest = BlogManifest(self.blog_path, version)
+        manifest.record(os.path.basename(self.post_path), build_post_record(self.post_path))
+        manifest.save()
+        return BlogManifest(self.blog_path, version)
+
+    def is_unchanged(self, manifest):
+        get_img_folder_index(self.blog_path, refresh=True)
+        return manifest.is_unchanged(self.post_path)
+
+    def test_unchanged_post(self):
+        manifest = self.record_post()
+        self.assertTrue(self.is_unchanged(manifest))
+        self.assertFalse(self.is_unchanged(BlogManifest(self.blog_path, '2')))
+        self.assertFalse(BlogManifest(self.blog_path, '1').is_unchanged(os.path.join(self.blog_path, 'Other.md')))
+
+    def test_touched_post_is_unchanged(self):
+        manifest = self.record_post()
+        os.utime(self.post_path, ns=(0, 0))
+        os.utime(self.img_path, ns=(0, 0))
+        self.assertTrue(self.is_unchanged(manifest))
+        # The new mtime is recorded, the content is not hashed again
+        self.assertEqual(manifest.posts[os.path.basename(self.post_path)]['mtime_ns'], 0)
+
+    def test_changed_post(self):
+        manifest = self.record_post()
+        self.write_file(self.post_path, b'# My Post edited\n')
+        self.assertFalse(self.is_unchanged(manifest))
+
+    def test_changed_image(self):
+        manifest = self.record_post()
+        self.write_file(self.img_path, b'gif')
+        os.utime(self.img_path, ns=(0, 0))
+        self.assertFalse(self.is_unchanged(manifest))
+
+    def test_added_and_removed_images(self):
+        manifest = self.record_post()
+        self.write_file(os.path.join(os.path.dirname(self.img_path), 'image002.png'), b'png2')
+        self.assertFalse(self.is_unchanged(manifest))
+        manifest = self.record_post()
+        os.remove(self.img_path)
+        self.assertFalse(self.is_unchanged(manifest))
+
+    def test_broken_manifest(self):
+        self.write_file(os.path.join(self.blog_path, '.automate_blog_manifest.json'), b'{broken')
+        self.assertEqual(BlogManifest(self.blog_path, '1').posts, {})
+
+    def test_prune(self):
+        manifest = self.record_post()
+        manifest.record('2021-01-03-Other.md', build_post_record(self.post_path))
+        manifest.prune(['2021-01-03-Other.md', '2021-01-04-New.md'])
+        self.assertEqual(list(manifest.posts), ['2021-01-03-Other.md'])
+
+    def test_image_hashes(self):
+        manifest = self.record_post()
+        self.assertEqual(list(manifest.get_image_hashes()), [os.path.abspath(self.img_path)])
+        size, mtime_ns, sha256 = manifest.get_image_hashes()[os.path.abspath(self.img_path)]
+        self.assertEqual(size, 3)
+        self.assertEqual(len(sha256), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
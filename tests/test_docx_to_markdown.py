@@ -0,0 +1,114 @@
+import io
+import unittest
+import zipfile
+
+import docx_to_markdown
+
+DOCUMENT_HEAD = ('<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+                 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+                 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+                 'xmlns:v="urn:schemas-microsoft-com:vml" '
+                 'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"><w:body>')
+DOCUMENT_TAIL = '</w:body></w:document>'
+RELATIONSHIPS = ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                 '<Relationship Id="rId1" Target="media/image1.png"/>'
+                 '<Relationship Id="rId2" Target="media/image2.jpeg"/>'
+                 '<Relationship Id="rId3" Target="https://example.com/page" TargetMode="External"/>'
+                 '</Relationships>')
+
+
+def paragraph(content, style=None, list_level=None):
+    properties = ''
+    if style is not None:
+        properties += '<w:pStyle w:val="{0}"/>'.format(style)
+    if list_level is not None:
+        properties += '<w:numPr><w:ilvl w:val="{0}"/></w:numPr>'.format(list_level)
+    return '<w:p>{0}{1}</w:p>'.format('<w:pPr>{0}</w:pPr>'.format(properties) if properties else '', content)
+
+
+def run(text, properties=''):
+    return '<w:r>{0}<w:t xml:space="preserve">{1}</w:t></w:r>'.format(
+        '<w:rPr>{0}</w:rPr>'.format(properties) if properties else '', text)
+
+
+def image(relationship_id):
+    return '<w:r><w:drawing><a:blip r:embed="{0}"/></w:drawing></w:r>'.format(relationship_id)
+
+
+def cell(text):
+    return '<w:tc>{0}</w:tc>'.format(paragraph(run(text)))
+
+
+def build_docx(body):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as docx_zip:
+        docx_zip.writestr('word/document.xml', DOCUMENT_HEAD + body + DOCUMENT_TAIL)
+        docx_zip.writestr('word/_rels/document.xml.rels', RELATIONSHIPS)
+        docx_zip.writestr('word/media/image1.png', b'png')
+        docx_zip.writestr('word/media/image2.jpeg', b'jpeg')
+    return zipfile.ZipFile(content)
+
+
+class IterMarkdownBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.written_images = []
+
+    def write_image(self, docx_zip, member_name, position):
+        self.written_images.append((member_name, docx_zip.read(member_name), position))
+        return 'img{0}.png'.format(position)
+
+    def convert(self, body, **kwargs):
+        with build_docx(body) as docx_zip:
+            return list(docx_to_markdown.iter_markdown_blocks(docx_zip, self.write_image, **kwargs))
+
+    def test_paragraphs_and_headings(self):
+        blocks = self.convert(paragraph(run('Title'), style='Heading1') + paragraph(run('Sub'), style='Heading2') +
+                              paragraph(run('Some ') + run('text')) + paragraph(''))
+        self.assertEqual(blocks, ['# Title', '## Sub', 'Some text'])
+
+    def test_emphasis_keeps_spaces_outside_markers(self):
+        blocks = self.convert(paragraph(run('plain ') + run('bold ', '<w:b/>') + run('italic', '<w:i/>') +
+                                        run(' both', '<w:b/><w:i/>') + run(' off', '<w:b w:val="0"/>')))
+        self.assertEqual(blocks, ['plain **bold** *italic* ***both*** off'])
+
+    def test_hyperlinks(self):
+        blocks = self.convert(paragraph(run('See ') + '<w:hyperlink r:id="rId3">' + run('the page') +
+                                        '</w:hyperlink>' + run(' and ') + '<w:hyperlink w:anchor="intro">' +
+                                        run('intro') + '</w:hyperlink>'))
+        self.assertEqual(blocks, ['See [the page](https://example.com/page) and [intro](#intro)'])
+
+    def test_lists_and_quotes(self):
+        blocks = self.convert(paragraph(run('one'), list_level=0) + paragraph(run('nested'), list_level=1) +
+                              paragraph(run('quoted'), style='Quote'))
+        self.assertEqual(blocks, ['- one', '  - nested', '> quoted'])
+
+    def test_tables(self):
+        blocks = self.convert(paragraph(run('Before')) +
+                              '<w:tbl><w:tr>{0}{1}</w:tr><w:tr>{2}{3}</w:tr></w:tbl>'
+                              .format(cell('A'), cell('B|C'), cell('1'), cell('2')))
+        self.assertEqual(blocks, ['Before', '| A | B\\|C |\n|---|---|\n| 1 | 2 |'])
+
+    def test_images_in_document_order(self):
+        blocks = self.convert(paragraph(run('before') + image('rId2') + run('after')) +
+                              paragraph(image('rId1') + image('rId2')) + paragraph(image('rId9')))
+        self.assertEqual(blocks, ['before', '![0](img0.png)', 'after', '![1](img1.png)', '![2](img0.png)'])
+        # Every image is written once, the first time it appears, the unknown relationship is skipped
+        self.assertEqual(self.written_images, [('word/media/image2.jpeg', b'jpeg', 0),
+                                               ('word/media/image1.png', b'png', 1)])
+
+    def test_format_image(self):
+        blocks = self.convert(paragraph(image('rId1')) + paragraph(image('rId1')),
+                              format_image=lambda position, link: '{0}:{1}'.format(position, link))
+        self.assertEqual(blocks, ['0:img0.png', '1:img0.png'])
+
+    def test_fallback_content_is_skipped(self):
+        blocks = self.convert(paragraph('<w:r><mc:AlternateContent><mc:Choice><w:drawing><a:blip r:embed="rId1"/>'
+                                        '</w:drawing></mc:Choice><mc:Fallback><w:pict><v:imagedata r:id="rId2"/>'
+                                        '</w:pict></mc:Fallback></mc:AlternateContent></w:r>'))
+        self.assertEqual(blocks, ['![0](img0.png)'])
+        self.assertEqual([member_name for member_name, _, _ in self.written_images], ['word/media/image1.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
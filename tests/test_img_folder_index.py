@@ -0,0 +1,110 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from automate_blog_content import ImgFolderIndex
+
+PART_1 = 'Azure AD Connect Sync Part 1_files'
+PART_2 = 'Azure AD Connect Sync Part 2_files'
+# The renamed names keep only the first 19 chars of the img folder name, both img folders have the same names
+RENAMED_IMG = 'Azure_AD_Connect_Sy_image001.png'
+
+
+def hashed_name(content):
+    return 'Azure_AD_Connect_Sy_image001_{0}.png'.format(hashlib.sha256(content).hexdigest()[:8])
+
+
+class ImgFolderIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+
+    def write_image(self, folder_name, img_file_name, content):
+        folder_path = os.path.join(self.blog_path, folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        img_path = os.path.join(folder_path, img_file_name)
+        with open(img_path, 'wb') as f:
+            f.write(content)
+        return img_path
+
+    def test_identical_images_are_stored_once(self):
+        self.write_image('Post A_files', 'image001.png', b'same')
+        self.write_image('Post A_files', 'image002.png', b'other')
+        self.write_image('Post B_files', 'image001.png', b'same')
+        self.write_image('Post B_files', 'image002.png', b'four')
+        index = ImgFolderIndex(self.blog_path)
+        self.assertEqual(index.get_dedup_map(),
+                         {('Post B_files', 'Post_B_files_image001.png'): 'Post_A_files_image001.png'})
+        self.assertEqual(index.get_canonical_image('Post B_files', 'Post_B_files_image001.png'),
+                         'Post_A_files_image001.png')
+        self.assertEqual(index.get_canonical_image('Post B_files', 'Post_B_files_image002.png'),
+                         'Post_B_files_image002.png')
+        self.assertEqual(index.get_canonical_image('Post A_files', 'Post_A_files_image001.png'),
+                         'Post_A_files_image001.png')
+
+    def test_colliding_names(self):
+        self.write_image(PART_1, 'image001.png', b'part 1')
+        self.write_image(PART_2, 'image001.png', b'part 2')
+        index = ImgFolderIndex(self.blog_path)
+        self.assertEqual(index.get_dedup_map(), {})
+        self.assertEqual(index.get_canonical_image(PART_1, RENAMED_IMG), RENAMED_IMG)
+        self.assertEqual(index.get_canonical_image(PART_2, RENAMED_IMG), hashed_name(b'part 2'))
+
+    def test_colliding_identical_images(self):
+        self.write_image(PART_1, 'image001.png', b'same')
+        self.write_image(PART_2, 'image001.png', b'same')
+        index = ImgFolderIndex(self.blog_path)
+        self.assertEqual(index.get_canonical_image(PART_2, RENAMED_IMG), RENAMED_IMG)
+        self.assertEqual(index.get_dedup_map(), {(PART_2, RENAMED_IMG): RENAMED_IMG})
+
+    def test_name_on_disk_stays_with_its_content(self):
+        self.write_image(PART_1, 'image001.png', b'part 1')
+        self.write_image(PART_2, 'image001.png', b'part 2')
+        # Part 2 has been stored first, before the post of Part 1 was added
+        self.write_image('images', RENAMED_IMG, b'part 2')
+        index = ImgFolderIndex(self.blog_path)
+        self.assertEqual(index.get_canonical_image(PART_1, RENAMED_IMG), hashed_name(b'part 1'))
+        self.assertEqual(index.get_canonical_image(PART_2, RENAMED_IMG), RENAMED_IMG)
+        self.assertFalse(index.is_stale_image(RENAMED_IMG))
+
+    def test_unknown_name_on_disk_is_kept(self):
+        self.write_image(PART_1, 'image001.png', b'part 1')
+        self.write_image('images', RENAMED_IMG, b'removed')
+        index = ImgFolderIndex(self.blog_path)
+        self.assertEqual(index.get_canonical_image(PART_1, RENAMED_IMG), hashed_name(b'part 1'))
+        self.assertFalse(index.is_stale_image(RENAMED_IMG))
+
+    def test_stale_image_on_disk(self):
+        img_path = self.write_image(PART_1, RENAMED_IMG, b'part 1 changed')
+        self.write_image(PART_2, 'image001.png', b'part 2')
+        self.write_image('images', RENAMED_IMG, b'part 1')
+        stat = os.stat(img_path)
+        index = ImgFolderIndex(self.blog_path)
+        # As recorded in the manifest, before the img folder has been exported again
+        index.add_known_hashes({img_path: (stat.st_size + 1, stat.st_mtime_ns, hashlib.sha256(b'part 1').hexdigest())})
+        self.assertEqual(index.get_canonical_image(PART_1, RENAMED_IMG), RENAMED_IMG)
+        self.assertEqual(index.get_canonical_image(PART_2, RENAMED_IMG), hashed_name(b'part 2'))
+        self.assertTrue(index.is_stale_image(RENAMED_IMG))
+
+    def test_known_hashes(self):
+        img_path_1 = self.write_image('Post A_files', 'image001.png', b'same')
+        img_path_2 = self.write_image('Post B_files', 'image001.png', b'diff')
+        stat = os.stat(img_path_2)
+        index = ImgFolderIndex(self.blog_path)
+        # A known hash is used while the image keeps the recorded size and mtime
+        index.add_known_hashes({img_path_2: (stat.st_size, stat.st_mtime_ns, hashlib.sha256(b'same').hexdigest())})
+        self.assertEqual(index.hash_image(img_path_2, stat), hashlib.sha256(b'same').hexdigest())
+        self.assertEqual(index.hash_image(img_path_1, os.stat(img_path_1)), hashlib.sha256(b'same').hexdigest())
+        self.assertEqual(index.get_dedup_map(),
+                         {('Post B_files', 'Post_B_files_image001.png'): 'Post_A_files_image001.png'})
+        os.utime(img_path_2, ns=(0, 0))
+        self.assertEqual(index.hash_image(img_path_2, os.stat(img_path_2)), hashlib.sha256(b'diff').hexdigest())
+        index.reset_stored_names()
+        self.assertEqual(index.get_dedup_map(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
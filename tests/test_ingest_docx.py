@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from automate_blog_content import BlogManifest, ingest_docx, ingest_docx_files
+from test_docx_to_markdown import DOCUMENT_HEAD, DOCUMENT_TAIL, RELATIONSHIPS, image, paragraph, run
+
+
+class IngestDocxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+        self.images_path = os.path.join(self.blog_path, 'images')
+
+    def write_docx(self, docx_file_name, img_data):
+        docx_path = os.path.join(self.blog_path, docx_file_name)
+        with zipfile.ZipFile(docx_path, 'w') as docx_zip:
+            docx_zip.writestr('word/document.xml', DOCUMENT_HEAD + paragraph(image('rId1')) + DOCUMENT_TAIL)
+            docx_zip.writestr('word/_rels/document.xml.rels', RELATIONSHIPS)
+            docx_zip.writestr('word/media/image1.png', img_data)
+        return docx_path
+
+    def read_image(self, img_file_name):
+        with open(os.path.join(self.images_path, img_file_name), 'rb') as f:
+            return f.read()
+
+    def read_links(self, md_path):
+        with open(md_path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.startswith('![')]
+
+    def test_colliding_image_names(self):
+        # Both image names keep only the first 19 chars of the .docx file name: 'Azure_AD_Connect_Sy_image001.png'
+        part_1_images = {}
+        part_2_images = {}
+        md_path_1 = ingest_docx(self.write_docx('Azure AD Connect Sync Part 1.docx', b'part 1'), 'aad',
+                                docx_images=part_1_images)
+        md_path_2 = ingest_docx(self.write_docx('Azure AD Connect Sync Part 2.docx', b'part 2'), 'aad',
+                                docx_images=part_2_images)
+        self.assertEqual(list(part_1_images), ['Azure_AD_Connect_Sy_image001.png'])
+        part_2_name = list(part_2_images)[0]
+        self.assertRegex(part_2_name, r'^Azure_AD_Connect_Sy_image001_[0-9a-f]{8}\.png$')
+        self.assertEqual(self.read_image('Azure_AD_Connect_Sy_image001.png'), b'part 1')
+        self.assertEqual(self.read_image(part_2_name), b'part 2')
+        self.assertEqual(self.read_links(md_path_1), ['![0](/assets/images/aad/Azure_AD_Connect_Sy_image001.png)'])
+        self.assertEqual(self.read_links(md_path_2), ['![0](/assets/images/aad/{0})'.format(part_2_name)])
+
+        # Converted again, each .docx file keeps its image names, and replaces only the images it wrote
+        ingest_docx(self.write_docx('Azure AD Connect Sync Part 2.docx', b'part 2'), 'aad', docx_images=part_2_images)
+        self.assertEqual(list(part_2_images), [part_2_name])
+        ingest_docx(self.write_docx('Azure AD Connect Sync Part 1.docx', b'part 1 changed'), 'aad',
+                    docx_images=part_1_images)
+        self.assertEqual(list(part_1_images), ['Azure_AD_Connect_Sy_image001.png'])
+        self.assertEqual(self.read_image('Azure_AD_Connect_Sy_image001.png'), b'part 1 changed')
+        self.assertEqual(self.read_image(part_2_name), b'part 2')
+        self.assertEqual(len(os.listdir(self.images_path)), 2)
+
+    def test_unknown_image_is_kept(self):
+        os.makedirs(self.images_path)
+        with open(os.path.join(self.images_path, 'Sync_image001.png'), 'wb') as f:
+            f.write(b'other')
+        md_path = ingest_docx(self.write_docx('Sync.docx', b'sync'), 'aad')
+        self.assertEqual(self.read_image('Sync_image001.png'), b'other')
+        self.assertEqual(len(self.read_links(md_path)), 1)
+        self.assertNotIn('Sync_image001.png)', self.read_links(md_path)[0])
+
+
+class IngestDocxFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+        self.docx_path = os.path.join(self.blog_path, 'Sync.docx')
+
+    def write_docx(self, text):
+        with zipfile.ZipFile(self.docx_path, 'w') as docx_zip:
+            docx_zip.writestr('word/document.xml', DOCUMENT_HEAD + paragraph(run(text)) + DOCUMENT_TAIL)
+            docx_zip.writestr('word/_rels/document.xml.rels', RELATIONSHIPS)
+
+    def ingest(self):
+        manifest = BlogManifest(self.blog_path, 'test')
+        md_paths = ingest_docx_files(self.blog_path, 'aad', manifest=manifest)
+        return [os.path.basename(md_path) for md_path in md_paths]
+
+    def rename_md_file(self):
+        # The .md file as renamed by rename_file and edited by the passes
+        os.rename(os.path.join(self.blog_path, 'Sync.md'), os.path.join(self.blog_path, '2021-01-02-Sync.md'))
+        with open(os.path.join(self.blog_path, '2021-01-02-Sync.md'), 'a', encoding='utf-8') as f:
+            f.write('edited\n')
+
+    def test_changed_docx_is_converted_again(self):
+        self.write_docx('first')
+        self.assertEqual(self.ingest(), ['Sync.md'])
+        self.rename_md_file()
+        self.assertEqual(self.ingest(), [])
+        # Touched but not modified
+        os.utime(self.docx_path, ns=(0, 0))
+        self.assertEqual(self.ingest(), [])
+        self.write_docx('second')
+        self.assertEqual(self.ingest(), ['2021-01-02-Sync.md'])
+        with open(os.path.join(self.blog_path, '2021-01-02-Sync.md'), 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'second\n\n')
+        self.assertEqual(self.ingest(), [])
+
+    def test_docx_converted_before_recording_is_kept(self):
+        self.write_docx('first')
+        ingest_docx_files(self.blog_path, 'aad')
+        self.rename_md_file()
+        self.assertEqual(self.ingest(), [])
+        self.write_docx('second')
+        self.assertEqual(self.ingest(), ['2021-01-02-Sync.md'])
+
+    def test_removed_docx_is_pruned(self):
+        self.write_docx('first')
+        self.ingest()
+        os.remove(self.docx_path)
+        self.ingest()
+        self.assertEqual(BlogManifest(self.blog_path, 'test').docx_files, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from automate_blog_content import PostCatalog, get_img_folder_index
+
+POST = ('---\n'
+        'title: "My Post"\n'
+        'author: "Me"\n'
+        '---\n'
+        '![0](/assets/images/aad/My_Post_files_image001.png)\n'
+        '![1](/assets/images/aad/Missing.png)\n'
+        '![2](My%20Post_files/image002.png)\n'
+        'See [the doc](https://nam06.safelinks.protection.outlook.com/?url=x).\n')
+
+
+class PostCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+        self.write_file('2021-01-02-My-Post.md', POST)
+        self.write_file(os.path.join('My Post_files', 'image001.png'), 'png')
+        self.write_file(os.path.join('images', 'My_Post_files_image001.png'), 'png')
+
+    def write_file(self, file_name, content):
+        file_path = os.path.join(self.blog_path, file_name)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return file_path
+
+    def update(self, catalog):
+        get_img_folder_index(self.blog_path, refresh=True)
+        return catalog.update()
+
+    def open_catalog(self):
+        catalog = PostCatalog(self.blog_path)
+        self.addCleanup(catalog.close)
+        return catalog
+
+    def test_update(self):
+        catalog = self.open_catalog()
+        self.assertEqual(self.update(catalog), (1, 0))
+        post = catalog.get_post(os.path.join(self.blog_path, '2021-01-02-My-Post.md'))
+        self.assertEqual((post['title'], post['date'], post['author'], post['img_folder']),
+                         ('My Post', '2021-01-02', 'Me', 'My Post_files'))
+        self.assertEqual((post['image_link_count'], post['link_count'], post['safelink_count']), (3, 1, 1))
+        # Unchanged posts are not scanned again, also when the catalog is opened again
+        self.assertEqual(self.update(self.open_catalog()), (0, 0))
+        self.write_file('2021-01-02-My-Post.md', POST.replace('Me', 'Someone else'))
+        self.assertIsNone(catalog.get_post(os.path.join(self.blog_path, '2021-01-02-My-Post.md')))
+        self.write_file('2021-01-03-Other.md', '# Other\n')
+        self.assertEqual(self.update(catalog), (2, 0))
+        self.assertEqual(catalog.get_post(os.path.join(self.blog_path, '2021-01-02-My-Post.md'))['author'],
+                         'Someone else')
+        os.remove(os.path.join(self.blog_path, '2021-01-03-Other.md'))
+        self.assertEqual(self.update(catalog), (0, 1))
+        self.assertEqual([tuple(row) for row in catalog.list_posts_by_date()],
+                         [('2021-01-02', '2021-01-02-My-Post.md', 'My Post', 'Someone else')])
+
+    def test_rename(self):
+        self.write_file('My Post.md', POST.replace('Me', 'Someone else'))
+        catalog = self.open_catalog()
+        self.assertEqual(self.update(catalog), (2, 0))
+        # rename_file replaces the post with the same name
+        os.replace(os.path.join(self.blog_path, 'My Post.md'), os.path.join(self.blog_path, '2021-01-02-My-Post.md'))
+        catalog.rename('My Post.md', '2021-01-02-My-Post.md')
+        self.assertIsNotNone(catalog.get_post(os.path.join(self.blog_path, '2021-01-02-My-Post.md')))
+        self.assertEqual(self.update(catalog), (0, 0))
+        # The date is found in the new file name
+        self.assertEqual([tuple(row) for row in catalog.list_posts_by_date()],
+                         [('2021-01-02', '2021-01-02-My-Post.md', 'My Post', 'Someone else')])
+        self.assertEqual(len(catalog.list_missing_images()), 2)
+
+    def test_list_missing_images(self):
+        catalog = self.open_catalog()
+        self.update(catalog)
+        self.assertEqual([tuple(row) for row in catalog.list_missing_images()],
+                         [('2021-01-02-My-Post.md', 1, '/assets/images/aad/Missing.png'),
+                          ('2021-01-02-My-Post.md', 2, 'My%20Post_files/image002.png')])
+        self.write_file(os.path.join('images', 'Missing.png'), 'png')
+        self.write_file(os.path.join('My Post_files', 'image002.png'), 'png')
+        self.write_file(os.path.join('My Post_files', 'image003.png'), 'png')
+        self.update(catalog)
+        self.assertEqual(catalog.list_missing_images(), [])
+
+    def test_list_posts_with_safelinks(self):
+        self.write_file('2021-01-03-Other.md', '# Other\n')
+        catalog = self.open_catalog()
+        self.update(catalog)
+        self.assertEqual([row[0] for row in catalog.list_posts_with_safelinks()], ['2021-01-02-My-Post.md'])
+
+
+if __name__ == '__main__':
+    unittest.main()
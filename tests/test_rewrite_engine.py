@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from automate_blog_content import DEFAULT_REWRITE_RULES, BlogDocument, RewriteEngine, find_group_reference
+
+FRONT_MATTER = '---\ntitle: Draft post\n> not a quote\n---\n'
+
+
+class RewriteEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.blog_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.blog_path)
+
+    def rewrite(self, rules, content):
+        """
+        :return: (rewritten content, stats of the post)
+        """
+        file_path = os.path.join(self.blog_path, 'post.md')
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        document = BlogDocument(file_path)
+        RewriteEngine(rules)(document)
+        return ''.join(document.lines), document.stats
+
+    def test_default_rules(self):
+        content, stats = self.rewrite(DEFAULT_REWRITE_RULES, FRONT_MATTER +
+                                      'See [the doc](https://nam06.safelinks.protection.outlook.com/?url=x) now.\n'
+                                      '> quoted (HTTPS://nam06.SafeLinks.protection.outlook.com/?url=y)\n'
+                                      'a > b\n')
+        self.assertEqual(content, FRONT_MATTER + 'See the doc now.\n quoted \na > b\n')
+        self.assertEqual(stats['rule_hits'], {'internal_link': 1, 'bare_internal_link': 1, 'start_bracket': 1})
+        self.assertEqual(stats['matches'], 3)
+
+    def test_scopes(self):
+        rules = [{'name': 'body_draft', 'pattern': 'Draft', 'replacement': 'Body'},
+                 {'name': 'all_post', 'pattern': 'post', 'replacement': 'page', 'scope': 'all'}]
+        content, stats = self.rewrite(rules, FRONT_MATTER + 'Draft post\n')
+        self.assertEqual(content, FRONT_MATTER.replace('post', 'page') + 'Body page\n')
+        self.assertEqual(stats['rule_hits'], {'body_draft': 1, 'all_post': 2})
+
+    def test_without_front_matter_body_is_whole_post(self):
+        content, _ = self.rewrite([{'name': 'dash', 'pattern': '^---$', 'replacement': '***'}], '---\ntext\n')
+        self.assertEqual(content, '***\ntext\n')
+
+    def test_group_expansion(self):
+        rules = [{'name': 'swap', 'pattern': r'(\w+)@(\w+)', 'replacement': r'\2 at \1'},
+                 {'name': 'named', 'pattern': r'#(?P<tag>\w+)', 'replacement': r'[\g<tag>](/tags/\1)'},
+                 {'name': 'no_groups', 'pattern': r'\bTODO\b'}]
+        content, stats = self.rewrite(rules, 'me@host #news TODO\n')
+        # The groups of every rule are numbered from 1, whatever the groups of the rules before it
+        self.assertEqual(content, 'host at me [news](/tags/news) \n')
+        self.assertEqual(stats['rule_hits'], {'swap': 1, 'named': 1, 'no_groups': 1})
+
+    def test_first_rule_wins(self):
+        rules = [{'name': 'first', 'pattern': 'ab', 'replacement': '1'},
+                 {'name': 'second', 'pattern': 'abc', 'replacement': '2'}]
+        content, stats = self.rewrite(rules, 'abc\n')
+        self.assertEqual(content, '1c\n')
+        self.assertEqual(stats['rule_hits'], {'first': 1})
+
+    def test_flags(self):
+        rules = [{'name': 'case', 'pattern': 'hello', 'replacement': 'bye', 'flags': 'i'},
+                 {'name': 'dotall', 'pattern': 'start.end', 'replacement': 'joined', 'flags': 's'},
+                 {'name': 'verbose', 'pattern': r'x \d+  # digits', 'replacement': 'n', 'flags': 'x'}]
+        content, _ = self.rewrite(rules, 'HELLO start\nend x42\n')
+        self.assertEqual(content, 'bye joined n\n')
+
+    def test_named_backreference(self):
+        rules = [{'name': 'word', 'pattern': r'(?P<first>[a-z]+)-', 'replacement': r'\1+'},
+                 {'name': 'double', 'pattern': r'\b(?P<char>\w)(?P=char)\b', 'replacement': r'\g<char>'}]
+        content, _ = self.rewrite(rules, 'aa bb-c\n')
+        self.assertEqual(content, 'a bb+c\n')
+
+    def test_no_rules(self):
+        content, stats = self.rewrite([], 'text\n')
+        self.assertEqual(content, 'text\n')
+        self.assertNotIn('rule_hits', stats)
+
+    def test_invalid_rules(self):
+        invalid_rules = [
+            ({'name': 'scope', 'pattern': 'a', 'scope': 'header'}, 'Invalid scope header of rewrite rule scope'),
+            ({'name': 'flags', 'pattern': 'a', 'flags': 'm'}, 'Invalid flags m of rewrite rule flags'),
+            ({'name': 'pattern', 'pattern': '(a'}, 'Invalid pattern of rewrite rule pattern'),
+            ({'name': 'backref', 'pattern': r'(\w)\1'}, 'rewrite rule backref refers to group 1 by number'),
+            ({'name': 'conditional', 'pattern': r'(<)?a(?(1)>)'}, 'rewrite rule conditional refers to group 1'),
+        ]
+        for rule, message in invalid_rules:
+            with self.assertRaises(ValueError) as context:
+                RewriteEngine([{'name': 'ok', 'pattern': '(b)'}, rule])
+            self.assertIn(message, str(context.exception))
+
+    def test_duplicate_group_names(self):
+        with self.assertRaises(ValueError) as context:
+            RewriteEngine([{'name': 'one', 'pattern': '(?P<g>a)'}, {'name': 'two', 'pattern': '(?P<g>b)'}])
+        self.assertEqual(str(context.exception),
+                         'Group name g of rewrite rule two is already used by rewrite rule one.')
+
+
+class FindGroupReferenceTest(unittest.TestCase):
+
+    def test_group_references(self):
+        self.assertEqual(find_group_reference(r'(a)(b)\2'), 2)
+        self.assertEqual(find_group_reference(r'\12x'), 12)
+        self.assertEqual(find_group_reference(r'(a)?(?(1)b|c)'), 1)
+        self.assertEqual(find_group_reference(r'[^]]\1'), 1)
+
+    def test_not_group_references(self):
+        for pattern in [r'\0', r'\012', r'\123', r'[\1]', r'[]\1]', r'\\1', r'\[\]', r'(?P<x>a)(?P=x)', r'\d+']:
+            self.assertIsNone(find_group_reference(pattern), pattern)
+
+
+if __name__ == '__main__':
+    unittest.main()